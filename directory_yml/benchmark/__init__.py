@@ -0,0 +1,12 @@
+"""
+ベンチマーク用パッケージ
+- synthetic: 再現可能な合成ディレクトリツリーの生成
+- runner:    走査/YAML生成の各フェーズの計測
+- scaling:   シャード走査のプロセス数ごとの計測
+- config_profiles: プロファイルを大量に持つ設定の保存の計測
+"""
+
+from .synthetic import TreeSpec, generate_tree
+from .runner import run_benchmark
+from .scaling import run_scaling_benchmark
+from .config_profiles import run_config_benchmark
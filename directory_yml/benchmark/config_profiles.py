@@ -0,0 +1,109 @@
+"""
+ConfigManager の保存の計測。
+プロファイルを大量に持つ config.json を一時ディレクトリに作り、
+プロファイル1件の更新にかかる時間を、毎回全体を json.dump し直す場合 (従来の保存) と比べる。
+あわせて、保存した内容が json.dump(indent=4) と一致するか、読み直して同じになるか、
+まとめて書き出す設定 (save_delay) で flush までファイルが書き換わらないかを確認する。
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from .. import __version__
+from ..config_manager import CONFIG_VERSION, ConfigManager
+
+
+def run_config_benchmark(profiles=5000, updates=50, list_length=20):
+    """
+    profiles 件のプロファイル (directories / ignore_patterns が各 list_length 件) を持つ設定で、
+    save_profile_data を updates 回実行して計測する。
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="dir2yaml_config_")
+    try:
+        config_path = os.path.join(tmp_dir, "config.json")
+        config_data = _make_config(profiles, list_length)
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config_data, f, ensure_ascii=False, indent=4)
+        names = list(config_data["profiles"])
+        targets = [names[i * len(names) // updates] for i in range(updates)]
+
+        # 従来の保存: 更新のたびに全体を直列化して書き直す
+        start = time.perf_counter()
+        for i, name in enumerate(targets):
+            config_data["profiles"][name] = _updated(config_data["profiles"][name], i)
+            config_data["active_profile"] = name
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump(config_data, f, ensure_ascii=False, indent=4)
+        full_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        manager = ConfigManager(config_path)
+        load_seconds = time.perf_counter() - start
+
+        # 更新のたびに書き出す (save_delay=0)。直列化し直すのは更新したプロファイルだけ
+        start = time.perf_counter()
+        for i, name in enumerate(targets):
+            manager.save_profile_data(name, _updated(manager.load_profile_data(name), i + updates))
+        immediate_seconds = time.perf_counter() - start
+        with open(config_path, "r", encoding="utf-8") as f:
+            written = f.read()
+        identical = written == json.dumps(manager.config_data, ensure_ascii=False, indent=4)
+        round_trip = ConfigManager(config_path).config_data == manager.config_data
+
+        # まとめて書き出す: 計測中にタイマーが走らないよう十分長い save_delay で、最後に flush する
+        coalesced = ConfigManager(config_path, save_delay=3600)
+        start = time.perf_counter()
+        for i, name in enumerate(targets):
+            coalesced.save_profile_data(name, _updated(coalesced.load_profile_data(name), i + updates * 2))
+        with open(config_path, "r", encoding="utf-8") as f:
+            deferred = f.read() == written
+        coalesced.flush()
+        coalesced_seconds = time.perf_counter() - start
+        with open(config_path, "r", encoding="utf-8") as f:
+            coalesced_identical = json.load(f) == coalesced.config_data
+
+        return {
+            "dir2yaml_version": __version__,
+            "profiles": profiles,
+            "updates": updates,
+            "list_length": list_length,
+            "config_bytes": os.path.getsize(config_path),
+            "load_seconds": round(load_seconds, 6),
+            "full_rewrite_seconds": round(full_seconds, 6),
+            "immediate_seconds": round(immediate_seconds, 6),
+            "coalesced_seconds": round(coalesced_seconds, 6),
+            "speedup": round(full_seconds / immediate_seconds, 2) if immediate_seconds > 0 else None,
+            "coalesced_deferred": deferred,
+            "identical": identical and round_trip and coalesced_identical and deferred,
+            "tmp_left": os.path.exists(config_path + ".tmp"),
+        }
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _make_config(profiles, list_length):
+    return {
+        "config_version": CONFIG_VERSION,
+        "profiles": {
+            f"profile{i + 1}": {
+                "project_name": f"プロジェクト{i + 1}",
+                "directories": [f"/srv/projects/p{i}/module{j}" for j in range(list_length)],
+                "ignore_patterns": [f"*.tmp{j}" for j in range(list_length)],
+                "max_file_size_bytes": 500000,
+                "content_budget_bytes": 0,
+                "hardlink_refs": False,
+            }
+            for i in range(profiles)
+        },
+        "active_profile": "profile1",
+    }
+
+
+def _updated(profile, i):
+    profile = dict(profile)
+    profile["directories"] = profile["directories"][1:] + [f"/srv/added/{i}"]
+    return profile
+
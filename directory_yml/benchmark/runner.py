@@ -0,0 +1,163 @@
+"""
+走査/YAML生成の各フェーズを計測し、結果を dict (JSON化可能) で返す。
+
+フェーズ:
+  walk        ディレクトリの列挙 (除外ルールは Scanner と同じ)
+  stat        全ファイルの os.stat
+  hash        全ファイルの sha256 計算
+  read_decode 全ファイルの読み込みとデコード (走査と同じ read_text()。sha256 は hash で計測するので除く)
+  scan        collect_directory_structures() 全体
+  serialize   generate_yaml()
+  write       write_yaml() (インデックス含む)
+"""
+
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from .. import __version__
+from ..file_processing import (
+    DEFAULT_IGNORE_PATTERNS,
+    EXCLUDED_DIRS,
+    _calc_sha256,
+    _is_ignored,
+    collect_directory_structures,
+)
+from ..text_decoding import DEFAULT_ENCODINGS, read_text
+from ..yml_generator import generate_yaml, write_yaml
+
+
+def run_benchmark(root_dir, ignore_patterns=None, max_file_size_bytes=None, repeat=1, encodings=None):
+    """
+    root_dir を対象に各フェーズを repeat 回計測し、最速値を採用した結果を返す。
+    encodings は内容の文字コードの候補 (None なら utf-8, cp932)。read_decode と scan の両方に使う。
+    """
+    if ignore_patterns is None:
+        ignore_patterns = list(DEFAULT_IGNORE_PATTERNS)
+    encodings = list(encodings or DEFAULT_ENCODINGS)
+
+    phases = {}
+
+    def measure(func):
+        return measure_best(func, repeat)
+
+    def record(name, seconds, files, nbytes):
+        phases[name] = _rates(seconds, files, nbytes)
+
+    file_paths, seconds = measure(lambda: _list_files(root_dir, ignore_patterns))
+    file_count = len(file_paths)
+    record("walk", seconds, file_count, 0)
+
+    sizes, seconds = measure(lambda: [os.stat(p).st_size for p in file_paths])
+    total_bytes = sum(sizes)
+    record("stat", seconds, file_count, 0)
+
+    _, seconds = measure(lambda: [_calc_sha256(p) for p in file_paths])
+    record("hash", seconds, file_count, total_bytes)
+
+    readable = [
+        (p, size) for p, size in zip(file_paths, sizes)
+        if max_file_size_bytes is None or size <= max_file_size_bytes
+    ]
+    _, seconds = measure(lambda: _read_decode((p for p, _size in readable), encodings))
+    record("read_decode", seconds, len(readable), sum(size for _p, size in readable))
+
+    structure, seconds = measure(
+        lambda: collect_directory_structures(
+            [root_dir], ignore_patterns, max_file_size_bytes=max_file_size_bytes, encodings=encodings
+        )
+    )
+    record("scan", seconds, file_count, total_bytes)
+
+    yaml_text, seconds = measure(lambda: generate_yaml(structure, "benchmark"))
+    yaml_bytes = len(yaml_text.encode("utf-8"))
+    record("serialize", seconds, file_count, yaml_bytes)
+    del yaml_text
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = os.path.join(tmp_dir, "benchmark.yml")
+        _, seconds = measure(lambda: write_yaml(structure, "benchmark", out_path))
+        record("write", seconds, file_count, yaml_bytes)
+
+    return {
+        "dir2yaml_version": __version__,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "root": os.path.abspath(root_dir),
+        "files": file_count,
+        "bytes": total_bytes,
+        "yaml_bytes": yaml_bytes,
+        "repeat": repeat,
+        "encodings": encodings,
+        "phases": phases,
+        # ru_maxrss はプロセス全体で下がらない値なので、フェーズごとではなく全体のピークだけ返す
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def measure_best(func, repeat=1):
+    """
+    func() を repeat 回実行し、(最後の戻り値, 最速の所要時間[秒]) を返す。
+    """
+    best = None
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def peak_rss_bytes():
+    """
+    プロセスのピークRSS[byte]。取得できない環境 (Windows など) では None。
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS は byte、Linux は KiB 単位
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _rates(seconds, files, nbytes):
+    return {
+        "seconds": round(seconds, 6),
+        "files_per_s": round(files / seconds, 1) if seconds > 0 and files else None,
+        "mb_per_s": round(nbytes / seconds / (1024 * 1024), 2) if seconds > 0 and nbytes else None,
+    }
+
+
+def _list_files(root_dir, ignore_patterns):
+    """
+    Scanner と同じ規則でファイルパスだけを列挙する。
+    """
+    results = []
+    stack = [root_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            items = sorted(os.listdir(current))
+        except PermissionError:
+            continue
+        for item in items:
+            full_path = os.path.join(current, item)
+            is_dir = os.path.isdir(full_path)
+            if item in EXCLUDED_DIRS and is_dir:
+                continue
+            if _is_ignored(item, ignore_patterns):
+                continue
+            if is_dir:
+                stack.append(full_path)
+            else:
+                results.append(full_path)
+    return results
+
+
+def _read_decode(file_paths, encodings):
+    for p in file_paths:
+        read_text(p, encodings, with_hash=False)
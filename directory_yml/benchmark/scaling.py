@@ -0,0 +1,70 @@
+"""
+シャード走査のスケーリング計測。
+同じツリーを1プロセス(Scanner.scan)と、1〜N プロセスのシャード走査で走査し、
+所要時間・速度向上率と、出力が1プロセスの場合と一致するかを dict (JSON化可能) で返す。
+"""
+
+import hashlib
+import os
+import platform
+import sys
+
+from .. import __version__
+from ..file_processing import DEFAULT_IGNORE_PATTERNS, Scanner
+from ..sharding import scan_sharded
+from ..yml_generator import generate_yaml
+from .runner import measure_best
+
+
+def run_scaling_benchmark(
+    root_dir,
+    ignore_patterns=None,
+    max_file_size_bytes=None,
+    max_processes=None,
+    repeat=1,
+    balance="size"
+):
+    """
+    プロセス数 1..max_processes (既定: CPU数) でシャード走査を repeat 回ずつ計測し、最速値を採用する。
+    """
+    if ignore_patterns is None:
+        ignore_patterns = list(DEFAULT_IGNORE_PATTERNS)
+    max_processes = max_processes or os.cpu_count() or 1
+    scanner = Scanner(ignore_patterns, max_file_size_bytes)
+
+    def measure(func):
+        return measure_best(func, repeat)
+
+    structure, serial_seconds = measure(lambda: scanner.scan([root_dir]))
+    expected = _digest(structure)
+    del structure
+
+    runs = []
+    for processes in range(1, max_processes + 1):
+        structure, seconds = measure(
+            lambda: scan_sharded(scanner, [root_dir], processes=processes, balance=balance)
+        )
+        runs.append({
+            "processes": processes,
+            "seconds": round(seconds, 6),
+            "speedup": round(serial_seconds / seconds, 2) if seconds > 0 else None,
+            "efficiency": round(serial_seconds / seconds / processes, 2) if seconds > 0 else None,
+            "identical": _digest(structure) == expected,
+        })
+        del structure
+
+    return {
+        "dir2yaml_version": __version__,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "root": os.path.abspath(root_dir),
+        "balance": balance,
+        "repeat": repeat,
+        "serial_seconds": round(serial_seconds, 6),
+        "runs": runs,
+    }
+
+
+def _digest(structure):
+    return hashlib.sha256(generate_yaml(structure, "benchmark").encode("utf-8")).hexdigest()
@@ -0,0 +1,60 @@
+"""
+起動時間の計測。
+別プロセスで `python -X importtime -c "import <module>"` を実行し、
+モジュールの累積インポート時間と、時間のかかっているモジュールを集計する。
+"""
+
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULE = "directory_yml.gui"
+
+
+def measure_import_time(module=DEFAULT_MODULE, repeat=5, top_n=10):
+    """
+    module の累積インポート時間[ms]を repeat 回計測し、最速の回の結果を返す。
+    """
+    project_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    best = None
+    for _ in range(max(repeat, 1)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=project_dir,
+            capture_output=True,
+            text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"{module} のインポートに失敗しました:\n{proc.stderr}")
+        entries = _parse_importtime(proc.stderr)
+        total_us = next((cum for name, _self, cum in entries if name == module), None)
+        if total_us is None:
+            raise RuntimeError(f"{module} のインポート時間を取得できませんでした")
+        if best is None or total_us < best[0]:
+            best = (total_us, entries)
+
+    total_us, entries = best
+    slowest = sorted(entries, key=lambda e: e[1], reverse=True)[:top_n]
+    return {
+        "module": module,
+        "import_ms": round(total_us / 1000, 2),
+        "loaded_modules": sorted(name for name, _self, _cum in entries),
+        "slowest_self_ms": [
+            {"module": name, "self_ms": round(self_us / 1000, 2)} for name, self_us, _cum in slowest
+        ],
+    }
+
+
+def _parse_importtime(stderr):
+    """
+    -X importtime の出力を (モジュール名, self[us], cumulative[us]) のリストにする。
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # ヘッダ行
+        entries.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return entries
@@ -0,0 +1,113 @@
+"""
+合成ディレクトリツリーの生成。
+同じ TreeSpec (seed を含む) からは常に同じツリーが生成される。
+"""
+
+import os
+import random
+from dataclasses import dataclass, asdict
+
+from ..file_processing import EXCLUDED_DIRS
+
+_WORDS = (
+    "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu "
+    "def class return import yield async await self None True False "
+    "ディレクトリ ファイル 設定 生成 走査"
+).split()
+
+
+@dataclass
+class TreeSpec:
+    fanout: int = 4                  # 1ディレクトリあたりのサブディレクトリ数
+    depth: int = 3                   # ルートからの深さ
+    files_per_dir: int = 10          # 1ディレクトリあたりのファイル数
+    median_file_size: int = 4096     # ファイルサイズ(対数正規分布)の中央値[byte]
+    file_size_sigma: float = 1.0     # 対数正規分布の sigma
+    max_file_size: int = 4 * 1024 * 1024
+    binary_ratio: float = 0.1        # バイナリファイルの割合
+    ignored_dir_share: float = 0.05  # EXCLUDED_DIRS 名のディレクトリにする割合
+    duplicate_ratio: float = 0.1     # 既出ファイルと同じ内容にする割合
+    seed: int = 0
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def generate_tree(root_dir, spec=None):
+    """
+    root_dir 以下に spec に従ったツリーを生成し、生成結果の集計を返す。
+    """
+    spec = spec or TreeSpec()
+    rng = random.Random(spec.seed)
+    text_block = _make_text_block(rng)
+    stats = {"dirs": 0, "files": 0, "bytes": 0, "binary_files": 0,
+             "duplicate_files": 0, "ignored_dirs": 0}
+    contents = []
+
+    os.makedirs(root_dir, exist_ok=True)
+    _fill_dir(root_dir, spec, rng, text_block, 0, stats, contents)
+    return stats
+
+
+def _fill_dir(dir_path, spec, rng, text_block, level, stats, contents):
+    stats["dirs"] += 1
+    for i in range(spec.files_per_dir):
+        if contents and rng.random() < spec.duplicate_ratio:
+            data, ext = rng.choice(contents)
+            stats["duplicate_files"] += 1
+        else:
+            size = min(int(rng.lognormvariate(0, spec.file_size_sigma) * spec.median_file_size),
+                       spec.max_file_size)
+            if rng.random() < spec.binary_ratio:
+                data, ext = _make_binary(rng, size), ".bin"
+            else:
+                data, ext = _make_text(rng, text_block, size), ".txt"
+            # 重複元の候補はメモリを食わないよう小さいものだけ保持
+            if len(data) <= 64 * 1024 and len(contents) < 256:
+                contents.append((data, ext))
+        if ext == ".bin":
+            stats["binary_files"] += 1
+
+        with open(os.path.join(dir_path, f"file_{i:04d}{ext}"), "wb") as f:
+            f.write(data)
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+
+    if level >= spec.depth:
+        return
+    for i in range(spec.fanout):
+        if rng.random() < spec.ignored_dir_share:
+            name = EXCLUDED_DIRS[i % len(EXCLUDED_DIRS)]
+            stats["ignored_dirs"] += 1
+        else:
+            name = f"dir_{level}_{i:03d}"
+        sub_dir = os.path.join(dir_path, name)
+        os.makedirs(sub_dir, exist_ok=True)
+        _fill_dir(sub_dir, spec, rng, text_block, level + 1, stats, contents)
+
+
+def _make_text_block(rng, size=64 * 1024):
+    words = []
+    length = 0
+    while length < size:
+        line = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 12))) + "\n"
+        words.append(line)
+        length += len(line)
+    return "".join(words).encode("utf-8")
+
+
+def _make_text(rng, text_block, size):
+    if size <= 0:
+        return b""
+    start = rng.randrange(len(text_block))
+    rotated = text_block[start:] + text_block[:start]
+    data = rotated * (size // len(rotated) + 1)
+    data = data[:size]
+    # 途中でマルチバイト文字を切らないように末尾を調整
+    return data.decode("utf-8", errors="ignore").encode("utf-8")
+
+
+def _make_binary(rng, size):
+    data = bytearray(rng.randbytes(max(size, 1)))
+    data[0] = 0
+    return bytes(data)
@@ -0,0 +1,439 @@
+"""
+コマンドラインインタフェース。
+引数なしで main.py を起動した場合はGUI、サブコマンドを指定した場合はこちらが使われる。
+"""
+
+import argparse
+import os
+import sys
+
+from .config_manager import load_profile_settings
+
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return 1
+    return args.func(args)
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="dir2yaml", description="Dir2YAML コマンドライン")
+    parser.add_argument("--config", default="config.json", help="設定ファイルのパス (既定: config.json)")
+    sub = parser.add_subparsers(dest="command")
+
+    p_scan = sub.add_parser("scan", help="プロファイルを走査してYAML(とインデックス)を書き出す")
+    p_scan.add_argument("-o", "--output", required=True, help="出力するYAMLファイル")
+    p_scan.add_argument("-p", "--profile", help="プロファイル名 (既定: アクティブプロファイル)")
+    p_scan.add_argument(
+        "--content-budget", type=int,
+        help="メモリに保持するファイル内容の上限[byte] (既定: プロファイルの content_budget_bytes, 0=無制限)"
+    )
+    p_scan.add_argument(
+        "--hardlink-refs", action="store_true", default=None,
+        help="2つ目以降のハードリンクは内容を出力せず hardlink_of で参照する (既定: プロファイルの hardlink_refs)"
+    )
+    p_scan.add_argument("--workers", type=int, default=1, help="sha256 計算/読み込みの並列スレッド数")
+    p_scan.add_argument(
+        "--encoding", dest="encodings", action="append", type=_encoding_arg,
+        help="内容の文字コードの候補。複数指定すると先頭から順に試す (既定: プロファイルの encodings / utf-8, cp932)"
+    )
+    p_scan.add_argument(
+        "--normalize-newlines", action="store_true", default=None,
+        help="内容の改行 (CRLF / CR) を LF に統一する (既定: プロファイルの normalize_newlines)"
+    )
+    p_scan.add_argument(
+        "--processes", type=int, default=1,
+        help="ルートをディレクトリ単位のシャードに分け、このプロセス数で並列に走査する (--hardlink-refs とは併用不可)"
+    )
+    p_scan.add_argument(
+        "--modified-since", type=_time_arg,
+        help="この日時以降に更新されたファイルのみ出力 (UNIX時刻 or ISO 8601。既定: プロファイルの modified_since)"
+    )
+    p_scan.add_argument(
+        "--modified-before", type=_time_arg,
+        help="この日時より前に更新されたファイルのみ出力 (既定: プロファイルの modified_before)"
+    )
+    p_scan.add_argument("--min-size", type=int, help="このサイズ[byte]未満のファイルを出力しない")
+    p_scan.add_argument("--max-size", type=int, help="このサイズ[byte]を超えるファイルを出力しない")
+    p_scan.add_argument(
+        "--prune-with-index", metavar="IDX",
+        help="前回スナップショットのインデックス。--modified-since と併用し、"
+             "変化の無いディレクトリのファイルを stat せずに除外する"
+    )
+    p_scan.set_defaults(func=_cmd_scan)
+
+    p_watch = sub.add_parser("watch", help="プロファイルを監視し、変更のたびにYAMLを更新する")
+    p_watch.add_argument("-o", "--output", required=True, help="出力するYAMLファイル")
+    p_watch.add_argument("-p", "--profile", help="プロファイル名 (既定: アクティブプロファイル)")
+    p_watch.add_argument("--debounce", type=float, default=0.2, help="書き出しまでの待ち時間[秒]")
+    p_watch.add_argument("--poll-interval", type=float, default=0.5, help="ポーリング間隔[秒]")
+    p_watch.add_argument("--polling", action="store_true", help="inotify を使わずポーリングする")
+    p_watch.set_defaults(func=_cmd_watch)
+
+    p_serve = sub.add_parser("serve", help="スナップショットを HTTP で返すローカルサービスを起動する")
+    p_serve.add_argument("--unix", metavar="PATH", help="待ち受ける Unix ソケット (既定: dir2yaml.sock)")
+    p_serve.add_argument(
+        "--tcp", action="store_true",
+        help="Unix ソケットの代わりに TCP で待ち受ける。認証は無く、同じホストの全ユーザーが接続できる"
+    )
+    p_serve.add_argument("--host", default="127.0.0.1", help="--tcp で待ち受けるアドレス (既定: 127.0.0.1)")
+    p_serve.add_argument("--port", type=int, default=8765, help="--tcp で待ち受けるポート (既定: 8765)")
+    p_serve.add_argument(
+        "--allow-any-root", action="store_true",
+        help="root= で任意のディレクトリを走査できるようにする (既定ではプロファイルに登録されたディレクトリとその配下だけ)"
+    )
+    p_serve.add_argument("--ttl", type=float, default=30.0, help="結果をキャッシュする秒数 (0=キャッシュしない)")
+    p_serve.add_argument(
+        "--max-entries", type=int, default=16,
+        help="キャッシュする結果の数の上限 (既定: 16)。結果ごとにツリー全体 (ファイル内容を含む) をメモリに持つ"
+    )
+    p_serve.add_argument(
+        "--no-mtime-check", action="store_true",
+        help="キャッシュを返す前にディレクトリの mtime を確認しない (TTL だけで判断する)"
+    )
+    p_serve.add_argument("--workers", type=int, default=1, help="sha256 計算/読み込みの並列スレッド数")
+    p_serve.add_argument(
+        "--cache-bytes", type=int, default=0,
+        help="走査をまたいでファイルの sha256/内容を再利用するキャッシュの上限[byte] (0=使わない)"
+    )
+    p_serve.set_defaults(func=_cmd_serve)
+
+    p_diff = sub.add_parser("diff", help="2つのスナップショットの差分を JSON Lines で出力する")
+    p_diff.add_argument("old", help="比較元のYAML")
+    p_diff.add_argument("new", help="比較先のYAML")
+    p_diff.add_argument("-o", "--output", help="出力先 (省略時は標準出力)")
+    p_diff.add_argument("--no-moves", action="store_true", help="移動(moved)を検出しない")
+    p_diff.set_defaults(func=_cmd_diff)
+
+    p_bench = sub.add_parser("bench", help="合成ツリーを生成し、各フェーズの処理時間を計測する")
+    _add_tree_arguments(p_bench)
+    p_bench.add_argument("-p", "--profile", help="文字コードの候補を読み込むプロファイル名")
+    p_bench.add_argument(
+        "--encoding", dest="encodings", action="append", type=_encoding_arg,
+        help="内容の文字コードの候補。複数指定すると先頭から順に試す (既定: --profile の encodings / utf-8, cp932)"
+    )
+    p_bench.set_defaults(func=_cmd_bench)
+
+    p_scale = sub.add_parser("scale", help="合成ツリーを生成し、シャード走査のプロセス数ごとの処理時間を計測する")
+    _add_tree_arguments(p_scale)
+    p_scale.add_argument("--max-processes", type=int, help="計測する最大プロセス数 (既定: CPU数)")
+    p_scale.add_argument("--balance", choices=("entries", "size"), default="size", help="シャードの分け方")
+    p_scale.set_defaults(func=_cmd_scale)
+
+    p_config = sub.add_parser("config-bench", help="プロファイルを大量に持つ設定で、設定の保存を計測する")
+    p_config.add_argument("--profiles", type=int, default=5000, help="プロファイル数")
+    p_config.add_argument("--updates", type=int, default=50, help="プロファイルを更新する回数")
+    p_config.add_argument("--list-length", type=int, default=20, help="各プロファイルの directories / ignore_patterns の件数")
+    p_config.add_argument("-o", "--output", help="結果JSONの出力先 (省略時は標準出力)")
+    p_config.set_defaults(func=_cmd_config_bench)
+
+    p_startup = sub.add_parser("startup", help="GUIモジュールのインポート時間を計測する (-X importtime)")
+    p_startup.add_argument("--module", default="directory_yml.gui", help="計測するモジュール")
+    p_startup.add_argument("--repeat", type=int, default=5, help="計測回数 (最速値を採用)")
+    p_startup.add_argument("--budget-ms", type=float, help="インポート時間の上限[ms]。超えたら終了コード1")
+    p_startup.add_argument(
+        "--forbid", default="yaml,pyperclip",
+        help="起動時に読み込まれてはいけないモジュール (カンマ区切り)。読み込まれたら終了コード1"
+    )
+    p_startup.set_defaults(func=_cmd_startup)
+
+    return parser
+
+
+def _add_tree_arguments(parser):
+    parser.add_argument("--root", help="計測対象のディレクトリ (省略時は一時ディレクトリに合成ツリーを生成)")
+    parser.add_argument("--keep", action="store_true", help="生成した合成ツリーを削除しない")
+    parser.add_argument("--repeat", type=int, default=1, help="各計測の繰り返し回数 (最速値を採用)")
+    parser.add_argument("--max-file-size", type=int, default=500000, help="最大ファイルサイズ[byte]")
+    parser.add_argument("-o", "--output", help="結果JSONの出力先 (省略時は標準出力)")
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--files-per-dir", type=int, default=10)
+    parser.add_argument("--median-file-size", type=int, default=4096)
+    parser.add_argument("--file-size-sigma", type=float, default=1.0)
+    parser.add_argument("--binary-ratio", type=float, default=0.1)
+    parser.add_argument("--ignored-dir-share", type=float, default=0.05)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def _encoding_arg(value):
+    import codecs
+    try:
+        codecs.lookup(value)
+    except LookupError:
+        raise argparse.ArgumentTypeError(f"未対応の文字コードです: {value}")
+    return value
+
+
+def _time_arg(value):
+    from .file_processing import parse_time
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日時として解釈できません (UNIX時刻 or ISO 8601): {value}")
+
+
+def _load_settings(args):
+    try:
+        return load_profile_settings(args.config, args.profile)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+
+def _print_progress(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _cmd_scan(args):
+    from .content_store import ContentSpillStore
+    from .file_processing import Scanner
+    from .scan_stats import ScanStats
+    from .yml_generator import write_yaml
+
+    settings = _load_settings(args)
+    budget = settings["content_budget_bytes"] if args.content_budget is None else args.content_budget
+    hardlink_refs = settings["hardlink_refs"] if args.hardlink_refs is None else args.hardlink_refs
+    normalize_newlines = (
+        settings["normalize_newlines"] if args.normalize_newlines is None else args.normalize_newlines
+    )
+    file_filter = _build_stat_filter(settings, args)
+    stats = ScanStats(top_n=5)
+    scanner = Scanner(
+        settings["ignore_patterns"],
+        settings["max_file_size_bytes"],
+        workers=args.workers,
+        hardlink_refs=hardlink_refs,
+        encodings=args.encodings or settings["encodings"],
+        normalize_newlines=normalize_newlines
+    )
+    with scanner, ContentSpillStore(budget) as content_store:
+        if args.processes > 1:
+            from .sharding import scan_sharded
+            structure_data = scan_sharded(
+                scanner,
+                settings["directories"],
+                processes=args.processes,
+                stats=stats,
+                content_store=content_store,
+                file_filter=file_filter
+            )
+        else:
+            structure_data = scanner.scan(
+                settings["directories"],
+                stats=stats,
+                content_store=content_store,
+                file_filter=file_filter
+            )
+        write_yaml(structure_data, settings["project_name"], args.output, stats=stats)
+    _print_progress(f"YAMLを保存しました: {args.output}")
+    _print_progress(stats.summary())
+    _print_progress(content_store.summary())
+    if file_filter is not None:
+        _print_progress(file_filter.summary())
+    return 0
+
+
+def _build_stat_filter(settings, args):
+    """
+    プロファイルの設定をコマンドライン引数で上書きして StatFilter を作る。条件が無ければ None。
+    """
+    from .file_processing import STAT_FILTER_KEYS, StatFilter
+
+    options = {
+        name: getattr(args, name) if getattr(args, name) is not None else settings[name]
+        for name in STAT_FILTER_KEYS
+    }
+    if args.prune_with_index and options["modified_since"] in (None, ""):
+        raise SystemExit("--prune-with-index は --modified-since (またはプロファイルの modified_since) と併用してください。")
+    if all(v is None or v == "" for v in options.values()):
+        return None
+    try:
+        return StatFilter(previous_index=args.prune_with_index, **options)
+    except ValueError as e:
+        # プロファイルの日時が不正 / インデックスの形式が違う
+        raise SystemExit(str(e))
+    except OSError as e:
+        raise SystemExit(f"インデックスを読み込めません: {e}")
+
+
+def _cmd_watch(args):
+    from .watcher import SnapshotWatcher
+
+    settings = _load_settings(args)
+    watcher = SnapshotWatcher(
+        settings["directories"],
+        settings["ignore_patterns"],
+        args.output,
+        settings["project_name"],
+        max_file_size_bytes=settings["max_file_size_bytes"],
+        encodings=settings["encodings"],
+        normalize_newlines=settings["normalize_newlines"],
+        progress_callback=_print_progress,
+        debounce=args.debounce,
+        poll_interval=args.poll_interval,
+        use_inotify=not args.polling
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+    return 0
+
+
+def _cmd_serve(args):
+    import socket
+    from .service import DEFAULT_UNIX_PATH, SnapshotService, create_server
+
+    # Unix ソケットが使えない環境 (古い Windows) では TCP で待ち受ける
+    unix_path = None if args.tcp or not hasattr(socket, "AF_UNIX") else (args.unix or DEFAULT_UNIX_PATH)
+    service = SnapshotService(
+        args.config,
+        ttl=args.ttl,
+        check_mtime=not args.no_mtime_check,
+        max_entries=args.max_entries,
+        workers=args.workers,
+        cache_bytes=args.cache_bytes,
+        progress_callback=_print_progress,
+        allow_any_root=args.allow_any_root
+    )
+    server = create_server(service, args.host, args.port, unix_path=unix_path)
+    _print_progress(f"待ち受けを開始しました: {unix_path or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+    return 0
+
+
+def _cmd_diff(args):
+    from .snapshot_diff import write_diff
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="\n") as out:
+            counts = write_diff(args.old, args.new, out, detect_moves=not args.no_moves)
+    else:
+        counts = write_diff(args.old, args.new, sys.stdout, detect_moves=not args.no_moves)
+    _print_progress(
+        f"追加 {counts['added']}件, 削除 {counts['removed']}件, "
+        f"変更 {counts['modified']}件, 移動 {counts['moved']}件"
+    )
+    return 0
+
+
+def _cmd_bench(args):
+    from .benchmark import run_benchmark
+
+    encodings = args.encodings
+    if encodings is None and args.profile:
+        encodings = _load_settings(args)["encodings"]
+    return _run_on_tree(
+        args,
+        lambda root_dir: run_benchmark(
+            root_dir, max_file_size_bytes=args.max_file_size, repeat=args.repeat, encodings=encodings
+        )
+    )
+
+
+def _cmd_scale(args):
+    from .benchmark import run_scaling_benchmark
+
+    return _run_on_tree(
+        args,
+        lambda root_dir: run_scaling_benchmark(
+            root_dir,
+            max_file_size_bytes=args.max_file_size,
+            max_processes=args.max_processes,
+            repeat=args.repeat,
+            balance=args.balance
+        )
+    )
+
+
+def _run_on_tree(args, run):
+    """
+    --root (無ければ合成ツリーを生成) に対して run(root_dir) を実行し、結果をJSONで出力する。
+    """
+    import json
+    import shutil
+    import tempfile
+    from .benchmark import TreeSpec, generate_tree
+
+    spec = None
+    tree_stats = None
+    root_dir = args.root
+    if root_dir is None or not os.path.isdir(root_dir):
+        spec = TreeSpec(
+            fanout=args.fanout,
+            depth=args.depth,
+            files_per_dir=args.files_per_dir,
+            median_file_size=args.median_file_size,
+            file_size_sigma=args.file_size_sigma,
+            binary_ratio=args.binary_ratio,
+            ignored_dir_share=args.ignored_dir_share,
+            duplicate_ratio=args.duplicate_ratio,
+            seed=args.seed
+        )
+        root_dir = root_dir or tempfile.mkdtemp(prefix="dir2yaml_bench_")
+        _print_progress(f"合成ツリーを生成します: {root_dir}")
+        tree_stats = generate_tree(root_dir, spec)
+
+    try:
+        result = run(root_dir)
+    finally:
+        if spec is not None and not args.keep:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    if spec is not None:
+        result["tree_spec"] = spec.to_dict()
+        result["tree"] = tree_stats
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+def _cmd_config_bench(args):
+    import json
+    from .benchmark import run_config_benchmark
+
+    result = run_config_benchmark(args.profiles, updates=args.updates, list_length=args.list_length)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if not result["identical"] or result["tmp_left"]:
+        return 1
+    return 0
+
+
+def _cmd_startup(args):
+    import json
+    from .benchmark.startup import measure_import_time
+
+    result = measure_import_time(args.module, repeat=args.repeat)
+    forbidden = [m.strip() for m in args.forbid.split(",") if m.strip()]
+    loaded = set(result["loaded_modules"])
+    result["forbidden_loaded"] = [m for m in forbidden if m in loaded]
+    result["budget_ms"] = args.budget_ms
+    result["within_budget"] = args.budget_ms is None or result["import_ms"] <= args.budget_ms
+    del result["loaded_modules"]
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result["within_budget"] or result["forbidden_loaded"]:
+        return 1
+    return 0
@@ -1,12 +1,36 @@
+import copy
 import json
 import os
+import threading
+
+from .text_decoding import DEFAULT_ENCODINGS
 
 CONFIG_VERSION = "1.0.0"  # バージョン表記
 
 class ConfigManager:
-    def __init__(self, config_path="config.json"):
+    """
+    config.json の読み書き。
+
+    変更は config_data に反映して「未保存」とし、save_delay 秒後にまとめて書き出す
+    (save_delay=0 なら変更のたびに書き出す)。書き出しは一時ファイルに書いてから置き換えるので、
+    途中で終了しても config.json が壊れない。書き出していない変更は flush() / close() と終了時に書き出す。
+    プロファイルごとの JSON テキストを覚えておき、変更のあったプロファイルだけを直列化し直す
+    (出力は json.dump(indent=4) と同じ)。
+    """
+
+    def __init__(self, config_path="config.json", save_delay=0.0):
         self.config_path = config_path
+        self.save_delay = save_delay
         self.config_data = {}
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        # プロファイル名 -> (直列化したときのデータ, JSONテキスト(UTF-8))
+        self._profile_texts = {}
+        if save_delay > 0:
+            import atexit
+            atexit.register(self.flush)
         self.load_config()
 
     def load_config(self):
@@ -14,6 +38,7 @@ class ConfigManager:
         config.json を読み込み、辞書形式で self.config_data に格納する。
         - 存在しない場合はデフォルト構造を初期化
         - バージョン表記がない/古い場合は migrate して保存
+        - 内容を補正しなかった場合は書き込まない (起動のたびに書き直さない)
         """
         if not os.path.exists(self.config_path):
             # ファイルが無い場合はデフォルト構造
@@ -24,7 +49,11 @@ class ConfigManager:
                         "project_name": "",
                         "directories": [],
                         "ignore_patterns": [],
-                        "max_file_size_bytes": 500000
+                        "max_file_size_bytes": 500000,
+                        "content_budget_bytes": 0,
+                        "hardlink_refs": False,
+                        "encodings": list(DEFAULT_ENCODINGS),
+                        "normalize_newlines": False
                     }
                 },
                 "active_profile": "profile1"
@@ -54,11 +83,10 @@ class ConfigManager:
         if "active_profile" not in self.config_data:
             if self.get_profile_names():
                 self.config_data["active_profile"] = self.get_profile_names()[0]
+                self.save_config(self.config_data)
             else:
                 self._init_default()
 
-        self.save_config(self.config_data)
-
     def _init_default(self):
         """デフォルトの構造を生成し保存"""
         self.config_data = {
@@ -68,7 +96,11 @@ class ConfigManager:
                     "project_name": "",
                     "directories": [],
                     "ignore_patterns": [],
-                    "max_file_size_bytes": 500000
+                    "max_file_size_bytes": 500000,
+                    "content_budget_bytes": 0,
+                    "hardlink_refs": False,
+                    "encodings": list(DEFAULT_ENCODINGS),
+                    "normalize_newlines": False
                 }
             },
             "active_profile": "profile1"
@@ -119,8 +151,87 @@ class ConfigManager:
         self.save_config(self.config_data)
 
     def save_config(self, config_data):
-        with open(self.config_path, "w", encoding="utf-8") as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=4)
+        """
+        config_data 全体を置き換えて保存する。
+        """
+        with self._lock:
+            self.config_data = config_data
+            self._profile_texts.clear()
+            self._mark_dirty()
+        self._schedule_flush()
+
+    def flush(self):
+        """
+        未保存の変更があれば書き出す。
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                chunks = self._serialize()
+                self._dirty = False
+            try:
+                _write_atomic(self.config_path, chunks)
+            except OSError:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def close(self):
+        self.flush()
+
+    def _mark_dirty(self, *profile_names):
+        # ロックの中で呼ぶ。書き出しは _schedule_flush() で (ロックの外で) 行う
+        for name in profile_names:
+            self._profile_texts.pop(name, None)
+        self._dirty = True
+
+    def _schedule_flush(self):
+        if self.save_delay <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._timer is not None or not self._dirty:
+                return
+            # 最初の変更から save_delay 秒後に、それまでの変更をまとめて書き出す
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _serialize(self):
+        """
+        json.dumps(config_data, ensure_ascii=False, indent=4) を UTF-8 にしたものを、
+        つなげずにバイト列のリストで返す (プロファイルの分は覚えておいたものをそのまま使う)。
+        """
+        if not self.config_data:
+            return [b"{}"]
+        chunks = [b"{\n"]
+        for i, (key, value) in enumerate(self.config_data.items()):
+            if i:
+                chunks.append(b",\n")
+            chunks.append(f"    {json.dumps(key, ensure_ascii=False)}: ".encode("utf-8"))
+            if key == "profiles" and isinstance(value, dict) and value:
+                chunks.append(b"{\n")
+                for j, (name, data) in enumerate(value.items()):
+                    if j:
+                        chunks.append(b",\n")
+                    chunks.append(self._profile_text(name, data))
+                chunks.append(b"\n    }")
+            else:
+                chunks.append(_dumps_nested(value, 1).encode("utf-8"))
+        chunks.append(b"\n}")
+        return chunks
+
+    def _profile_text(self, name, data):
+        cached = self._profile_texts.get(name)
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        text = f"        {json.dumps(name, ensure_ascii=False)}: {_dumps_nested(data, 2)}".encode("utf-8")
+        self._profile_texts[name] = (data, text)
+        return text
 
     # -----------------------------
     # プロファイル操作用 ヘルパー
@@ -132,18 +243,24 @@ class ConfigManager:
         return self.config_data.get("active_profile", "")
 
     def set_active_profile(self, profile_name):
-        if profile_name in self.get_profile_names():
-            self.config_data["active_profile"] = profile_name
-            self.save_config(self.config_data)
+        with self._lock:
+            if profile_name in self.get_profile_names():
+                self.config_data["active_profile"] = profile_name
+                self._mark_dirty()
+        self._schedule_flush()
 
     def load_profile_data(self, profile_name):
-        return self.config_data.get("profiles", {}).get(profile_name, {})
+        # 呼び出し側で書き換えても保存済みの内容に影響しないよう、コピーを返す
+        with self._lock:
+            return copy.deepcopy(self.config_data.get("profiles", {}).get(profile_name, {}))
 
     def save_profile_data(self, profile_name, data):
-        self.config_data.setdefault("profiles", {})
-        self.config_data["profiles"][profile_name] = data
-        self.config_data["active_profile"] = profile_name
-        self.save_config(self.config_data)
+        with self._lock:
+            self.config_data.setdefault("profiles", {})
+            self.config_data["profiles"][profile_name] = copy.deepcopy(data)
+            self.config_data["active_profile"] = profile_name
+            self._mark_dirty(profile_name)
+        self._schedule_flush()
 
     def create_new_profile(self):
         existing = self.get_profile_names()
@@ -164,7 +281,11 @@ class ConfigManager:
             "project_name": "",
             "directories": [],
             "ignore_patterns": [],
-            "max_file_size_bytes": 500000
+            "max_file_size_bytes": 500000,
+            "content_budget_bytes": 0,
+            "hardlink_refs": False,
+            "encodings": list(DEFAULT_ENCODINGS),
+            "normalize_newlines": False
         }
         self.save_profile_data(new_name, default_data)
         return new_name
@@ -182,10 +303,7 @@ class ConfigManager:
             new_name = f"{base_new_name}({idx})"
             idx += 1
 
-        import copy
-        new_data = copy.deepcopy(src_data)
-
-        self.save_profile_data(new_name, new_data)
+        self.save_profile_data(new_name, src_data)
         return new_name
 
     def rename_profile(self, old_name, new_name):
@@ -194,14 +312,15 @@ class ConfigManager:
         if old_name not in self.get_profile_names():
             return None
 
-        data = self.load_profile_data(old_name)
-        self.config_data["profiles"][new_name] = data
-        del self.config_data["profiles"][old_name]
+        with self._lock:
+            data = self.config_data["profiles"].pop(old_name)
+            self.config_data["profiles"][new_name] = data
 
-        if self.config_data["active_profile"] == old_name:
-            self.config_data["active_profile"] = new_name
+            if self.config_data["active_profile"] == old_name:
+                self.config_data["active_profile"] = new_name
 
-        self.save_config(self.config_data)
+            self._mark_dirty(old_name, new_name)
+        self._schedule_flush()
         return new_name
 
     def delete_profile(self, profile_name):
@@ -211,10 +330,81 @@ class ConfigManager:
         all_profiles = self.get_profile_names()
         if len(all_profiles) == 1 and all_profiles[0] == profile_name:
             self._init_default()
-        else:
+            return
+        with self._lock:
             del self.config_data["profiles"][profile_name]
             if self.config_data["active_profile"] == profile_name:
                 remain = self.get_profile_names()
                 if remain:
                     self.config_data["active_profile"] = remain[0]
-        self.save_config(self.config_data)
+            self._mark_dirty(profile_name)
+        self._schedule_flush()
+
+
+def _dumps_nested(value, level):
+    """
+    深さ level の位置に置く値を json.dumps(indent=4) と同じ形で直列化する。
+    """
+    text = json.dumps(value, ensure_ascii=False, indent=4)
+    return text.replace("\n", "\n" + "    " * level)
+
+
+def _write_atomic(path, chunks):
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.writelines(chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_profile_settings(config_path, profile_name=None):
+    """
+    プロファイルから走査に必要な設定を取り出す。
+    ignore_patterns にはデフォルトの除外パターンも含める (GUIと同じ)。
+    """
+    return profile_settings(ConfigManager(config_path), profile_name)
+
+
+def profile_settings(config_manager, profile_name=None):
+    """
+    読み込み済みの config_manager から load_profile_settings() と同じ設定を取り出す。
+    プロファイルが無ければ ValueError。
+    """
+    from .file_processing import DEFAULT_IGNORE_PATTERNS
+
+    profile_name = profile_name or config_manager.get_active_profile_name()
+    if profile_name not in config_manager.get_profile_names():
+        raise ValueError(f"プロファイル '{profile_name}' は存在しません。")
+
+    pd = config_manager.load_profile_data(profile_name)
+    directories = pd.get("directories", [])
+    project_name = pd.get("project_name", "") or default_project_name(directories)
+    return {
+        "directories": directories,
+        "ignore_patterns": DEFAULT_IGNORE_PATTERNS + pd.get("ignore_patterns", []),
+        "max_file_size_bytes": pd.get("max_file_size_bytes", 500000),
+        "content_budget_bytes": pd.get("content_budget_bytes", 0),
+        "hardlink_refs": pd.get("hardlink_refs", False),
+        "encodings": pd.get("encodings") or None,
+        "normalize_newlines": pd.get("normalize_newlines", False),
+        "modified_since": pd.get("modified_since"),
+        "modified_before": pd.get("modified_before"),
+        "min_size": pd.get("min_size"),
+        "max_size": pd.get("max_size"),
+        "project_name": project_name,
+    }
+
+
+def default_project_name(directories):
+    if not directories:
+        return "UnnamedProject"
+    folder_names = [os.path.basename(os.path.normpath(d)) for d in directories]
+    return "_".join(folder_names)
@@ -0,0 +1,170 @@
+"""
+走査中のファイル内容の置き場所。
+メモリ上に保持する内容の合計が上限(budget)を超えたら、以降のファイル内容は
+一時ファイル(追記のみ)へ書き出し、ノードにはその位置(SpilledContent)だけを持たせる。
+上限を超えると分かっているファイルは、spill_writer() でデコードしながら直接書き出す
+(内容全体を文字列として持たない)。
+YAML出力時に yml_generator が SpilledContent を読み戻す。
+"""
+
+import tempfile
+import threading
+
+
+class SpilledContent:
+    """
+    一時ファイルへ逃がしたファイル内容への参照。
+    """
+
+    __slots__ = ("store", "offset", "length")
+
+    def __init__(self, store, offset, length):
+        self.store = store
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+        return self.store.read(self.offset, self.length)
+
+    def __eq__(self, other):
+        if isinstance(other, SpilledContent):
+            return (self.store, self.offset, self.length) == (other.store, other.offset, other.length)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SpilledContent(offset={self.offset}, length={self.length})"
+
+
+class ContentSpillStore:
+    """
+    budget_bytes: メモリ上に保持するファイル内容の上限[byte] (UTF-8換算)。
+                  0 / None の場合は上限なし (一時ファイルを使わない)
+    """
+
+    def __init__(self, budget_bytes=None, temp_dir=None):
+        self.budget_bytes = budget_bytes or 0
+        self.temp_dir = temp_dir
+        self.in_memory_bytes = 0
+        self.spilled_bytes = 0
+        self.spilled_files = 0
+        self._spill_file = None
+        self._lock = threading.Lock()
+
+    def put(self, text, size_hint=None):
+        """
+        text をメモリに残すか一時ファイルへ書き出すかを決め、ノードに入れる値を返す。
+        size_hint: text の UTF-8 バイト数が分かっていれば渡す (再エンコードを避ける)
+        """
+        size = size_hint if size_hint is not None else len(text.encode("utf-8"))
+        with self._lock:
+            if not self.budget_bytes or self.in_memory_bytes + size <= self.budget_bytes:
+                self.in_memory_bytes += size
+                return text
+
+            data = text.encode("utf-8")
+            f = self._spill_end()
+            offset = f.tell()
+            f.write(data)
+            self.spilled_bytes += len(data)
+            self.spilled_files += 1
+        return SpilledContent(self, offset, len(data))
+
+    def spill_writer(self, size_hint):
+        """
+        size_hint[byte] の内容がメモリの上限に収まらない場合、一時ファイルへ直接書き出す _SpillWriter を返す。
+        収まる場合は None (読み終えてから put() する)。
+        内容を連続した領域に置くため、commit() / abort() までは他の書き出しを待たせる。
+        """
+        if not self.budget_bytes:
+            return None
+        self._lock.acquire()
+        if self.in_memory_bytes + size_hint <= self.budget_bytes:
+            self._lock.release()
+            return None
+        return _SpillWriter(self, self._spill_end())
+
+    def _spill_end(self):
+        # ロックの中で呼ぶ。書き出し先を末尾に合わせて返す
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix="dir2yaml_spill_", dir=self.temp_dir)
+        f = self._spill_file
+        f.seek(0, 2)
+        return f
+
+    def read(self, offset, length):
+        with self._lock:
+            f = self._spill_file
+            f.seek(offset)
+            data = f.read(length)
+        return data.decode("utf-8")
+
+    def close(self):
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def summary(self):
+        """
+        進捗ログ向けの1行サマリ。
+        """
+        mb = 1024 * 1024
+        return (
+            f"ファイル内容: メモリ {self.in_memory_bytes / mb:.1f}MB, "
+            f"一時ファイル {self.spilled_bytes / mb:.1f}MB ({self.spilled_files}件)"
+        )
+
+
+class _SpillWriter:
+    """
+    ContentSpillStore.spill_writer() の戻り値。text_decoding.read_text() の out として渡す。
+    作成時に取得したストアのロックは commit() / abort() で解放する。
+    """
+
+    def __init__(self, store, f):
+        self.store = store
+        self.f = f
+        self.offset = f.tell()
+        self.length = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.f.write(data)
+        self.length += len(data)
+
+    def reset(self):
+        self.f.seek(self.offset)
+        self.f.truncate()
+        self.length = 0
+
+    def commit(self):
+        """
+        書き出した内容を確定し、SpilledContent を返す。
+        """
+        store = self.store
+        store.spilled_bytes += self.length
+        store.spilled_files += 1
+        store._lock.release()
+        return SpilledContent(store, self.offset, self.length)
+
+    def abort(self):
+        self.reset()
+        self.store._lock.release()
+
+
+def resolve_content(node):
+    """
+    content が SpilledContent のファイルノードを、内容を読み戻した dict にして返す。
+    それ以外はそのまま返す。
+    """
+    content = node.get("content")
+    if isinstance(content, SpilledContent):
+        node = dict(node)
+        node["content"] = content.read()
+    return node
@@ -1,7 +1,14 @@
+import codecs
 import os
 import fnmatch
+import re
+import threading
 import time
-import hashlib
+from collections import OrderedDict
+
+from .content_store import SpilledContent
+from .text_decoding import DEFAULT_ENCODINGS, read_text
+from .yml_generator import make_index_key, unique_root_names
 
 EXCLUDED_DIRS = [
     ".git",
@@ -14,163 +21,771 @@ EXCLUDED_DIRS = [
     "__pycache__"
 ]
 
+DEFAULT_IGNORE_PATTERNS = [".env", ".htpasswd", "*.log"]
+
+# ノード自体は出力するが、内容を "[SKIPPED by name]" にするファイル名のパターン
+DEFAULT_SKIP_CONTENT_PATTERNS = [".env", ".htpasswd", "*.log"]
+
+SKIPPED_BY_NAME = "[SKIPPED by name]"
+SKIPPED_BY_SIZE = "[SKIPPED due to size]"
+SKIPPED_BINARY = "[SKIPPED or BINARY]"
+
 def collect_directory_structures(
     directories,
     ignore_patterns,
     progress_callback=None,
-    max_file_size_bytes=None
+    max_file_size_bytes=None,
+    stats=None,
+    content_store=None,
+    hardlink_refs=False,
+    file_filter=None,
+    encodings=None,
+    normalize_newlines=False
 ):
     """
     複数ディレクトリを走査し、それぞれを「ルートディレクトリ」として構造を取得。
+    stats に ScanStats を渡すと、フェーズごとの時間などを計測する。
+    content_store に ContentSpillStore を渡すと、ファイル内容の保持量が上限を超えた分は
+    一時ファイルへ書き出され、ノードの content は SpilledContent になる。
+    同じ実体のハードリンクは2つ目以降の再ハッシュ・再読み込みを省く。
+    hardlink_refs=True の場合、2つ目以降は内容を持たず hardlink_of で最初のファイルを参照する。
+    file_filter に StatFilter を渡すと、更新日時/サイズの範囲外のファイルを
+    stat の時点で(ハッシュ計算や読み込みの前に)除外する。
+    encodings は内容の文字コードの候補 (先頭から順に試す)。normalize_newlines=True なら改行を LF に統一する。
+
+    同じ設定で何度も走査する場合は Scanner を作って使い回すほうが速い。
     """
-    results = []
-    for root_dir in directories:
-        if os.path.isdir(root_dir):
+    scanner = Scanner(
+        ignore_patterns,
+        max_file_size_bytes,
+        hardlink_refs=hardlink_refs,
+        encodings=encodings,
+        normalize_newlines=normalize_newlines
+    )
+    return scanner.scan(
+        directories,
+        progress_callback=progress_callback,
+        stats=stats,
+        content_store=content_store,
+        file_filter=file_filter
+    )
+
+
+class Scanner:
+    """
+    走査の設定をまとめたもの。一度作れば、複数のスレッドから同時に scan() / iter_nodes() を呼んでよい。
+    除外パターンはコンパイル済みの正規表現として、ファイルの sha256 と内容のキャッシュは
+    呼び出しをまたいで共有する。計測(stats)や内容の置き場所(content_store)は呼び出しごとに渡す。
+
+    ignore_patterns:       走査しないファイル/フォルダ名のパターン
+    max_file_size_bytes:   これを超えるファイルは内容を "[SKIPPED due to size]" にする
+    skip_content_patterns: 内容を "[SKIPPED by name]" にするファイル名のパターン
+    excluded_dirs:         中身を走査せず、空のフォルダとして出力するフォルダ名
+    digest:                "sha256" または None (ハッシュを計算しない)
+    workers:               ファイルの sha256 計算/読み込みを並列に行うスレッド数
+    hardlink_refs:         2つ目以降のハードリンクは内容を持たず hardlink_of で最初のファイルを参照する
+    cache_bytes:           sha256 と内容のキャッシュの上限[byte]。0 ならキャッシュしない。
+                           パスと stat (サイズ, mtime, ctime, inode) が一致するファイルは再読み込みしない
+    encodings:             内容の文字コードの候補。BOM が無ければ先頭から順に試し、
+                           判定した文字コードをノードの encoding に記録する (既定: utf-8, cp932)
+    normalize_newlines:    内容の改行 (CRLF / CR) を LF に統一する
+    """
+
+    def __init__(
+        self,
+        ignore_patterns=None,
+        max_file_size_bytes=None,
+        skip_content_patterns=None,
+        excluded_dirs=None,
+        digest="sha256",
+        workers=1,
+        hardlink_refs=False,
+        cache_bytes=0,
+        encodings=None,
+        normalize_newlines=False
+    ):
+        if digest not in ("sha256", None):
+            raise ValueError(f"未対応のダイジェストです: {digest}")
+        for encoding in encodings or ():
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                raise ValueError(f"未対応の文字コードです: {encoding}") from None
+        if skip_content_patterns is None:
+            skip_content_patterns = DEFAULT_SKIP_CONTENT_PATTERNS
+        self.ignore_patterns = list(ignore_patterns or [])
+        self.max_file_size_bytes = max_file_size_bytes
+        self.skip_content_patterns = list(skip_content_patterns)
+        self.excluded_dirs = frozenset(EXCLUDED_DIRS if excluded_dirs is None else excluded_dirs)
+        self.digest = digest
+        self.workers = max(workers or 1, 1)
+        self.hardlink_refs = hardlink_refs
+        self.cache_bytes = cache_bytes
+        self.encodings = list(encodings or DEFAULT_ENCODINGS)
+        self.normalize_newlines = normalize_newlines
+        self._ignore_match = _compile_patterns(self.ignore_patterns)
+        self._skip_content_match = _compile_patterns(self.skip_content_patterns)
+        self._cache = _FileCache(cache_bytes) if cache_bytes else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # 走査
+    # -----------------------------
+    def scan(self, directories, progress_callback=None, stats=None, content_store=None, file_filter=None):
+        """
+        collect_directory_structures() と同じ形のツリーを返す。
+        """
+        ctx = self._context(progress_callback, stats, content_store, file_filter, per_scan=True)
+        if stats is not None:
+            stats.start_profile()
+        try:
+            results = []
+            roots = [d for d in directories if os.path.isdir(d)]
+            for root_dir, root_name in zip(roots, unique_root_names(roots)):
+                if progress_callback:
+                    progress_callback(f"ディレクトリ走査開始: {root_dir}")
+                ctx.root_name = root_name
+                results.append({
+                    "root": root_name,
+                    "children": self._walk(ctx, root_dir, root_dir)
+                })
+            return results
+        finally:
+            if stats is not None:
+                stats.stop_profile()
+
+    def iter_nodes(self, directories, progress_callback=None, stats=None, content_store=None, file_filter=None):
+        """
+        ツリーを組み立てずに (ルート名, ノード) を YAML と同じ順(深さ優先)で返すジェネレータ。
+        ディレクトリのノードは children を持たない (中身はその後に続く)。
+        メモリに保持するのは走査中のディレクトリ直下のファイルの分だけ。
+        """
+        ctx = self._context(progress_callback, stats, content_store, file_filter, per_scan=True)
+        roots = [d for d in directories if os.path.isdir(d)]
+        for root_dir, root_name in zip(roots, unique_root_names(roots)):
             if progress_callback:
                 progress_callback(f"ディレクトリ走査開始: {root_dir}")
-            root_name = os.path.basename(os.path.normpath(root_dir))
-            structure = {
-                "root": root_name,
-                "children": _walk_directory(
-                    root_dir,
-                    current_dir=root_dir,
-                    ignore_patterns=ignore_patterns,
-                    progress_callback=progress_callback,
-                    max_file_size_bytes=max_file_size_bytes
-                )
-            }
-            results.append(structure)
-    return results
+            ctx.root_name = root_name
+            for node in self._iter_walk(ctx, root_dir, root_dir):
+                yield root_name, node
 
+    def scan_directory(self, root_dir, dir_path, progress_callback=None):
+        """
+        dir_path 以下を走査し、ディレクトリのノードを返す。
+        """
+        return self._walk(self._context(progress_callback), root_dir, dir_path)
 
-def _walk_directory(
-    root_dir,
-    current_dir,
-    ignore_patterns,
-    progress_callback,
-    max_file_size_bytes
-):
-    rel_path = os.path.relpath(current_dir, root_dir)  # root_dirからの相対パス
-    if rel_path == ".":
-        rel_path = ""
+    def build_child(self, root_dir, current_dir, item, progress_callback=None):
+        """
+        current_dir 直下のエントリ item のノードを返す。除外パターンに一致した場合は None。
+        """
+        ctx = self._context(progress_callback)
+        entry = self._classify(ctx, root_dir, current_dir, item)
+        if entry is None:
+            return None
+        kind, value = entry
+        if kind == "dir":
+            return self._walk(ctx, root_dir, value)
+        if kind == "file":
+            return self._file_node(ctx, root_dir, value)
+        return value
 
-    dir_name = os.path.basename(os.path.normpath(current_dir))
-    structure = {
-        "type": "directory",
-        "name": dir_name if rel_path else ".",
-        "rel_path": rel_path,
-        "children": []
-    }
+    def scan_file(self, root_dir, file_path, progress_callback=None):
+        return self._file_node(self._context(progress_callback), root_dir, file_path)
 
-    try:
-        items = os.listdir(current_dir)
-    except PermissionError:
-        if progress_callback:
-            progress_callback(f"[アクセス拒否] {current_dir}")
+    def options(self):
+        """
+        同じ設定の Scanner を作るための引数 (別プロセスへ設定を渡す場合など)。
+        """
+        return {
+            "ignore_patterns": self.ignore_patterns,
+            "max_file_size_bytes": self.max_file_size_bytes,
+            "skip_content_patterns": self.skip_content_patterns,
+            "excluded_dirs": sorted(self.excluded_dirs),
+            "digest": self.digest,
+            "workers": self.workers,
+            "hardlink_refs": self.hardlink_refs,
+            "cache_bytes": self.cache_bytes,
+            "encodings": self.encodings,
+            "normalize_newlines": self.normalize_newlines,
+        }
+
+    def is_ignored(self, item_name):
+        return self._ignore_match is not None and self._ignore_match(os.path.normcase(item_name)) is not None
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # -----------------------------
+    # 内部処理
+    # -----------------------------
+    def _context(self, progress_callback=None, stats=None, content_store=None, file_filter=None, per_scan=False):
+        # ハードリンクの追跡は1回の走査の中だけで行う
+        hardlinks = HardlinkTracker(emit_refs=self.hardlink_refs) if per_scan else None
+        return _ScanContext(progress_callback, stats, content_store, file_filter, hardlinks)
+
+    def _walk(self, ctx, root_dir, current_dir):
+        stats = ctx.stats
+        if stats is not None:
+            dir_start = time.perf_counter()
+
+        structure = _dir_node(root_dir, current_dir)
+        children = structure["children"] = []
+        # サブディレクトリの走査時間は除き、このディレクトリ自身 (列挙と直下のファイル) の時間を記録する
+        subdir_seconds = 0.0
+        for kind, value in self._resolve(ctx, root_dir, self._list_entries(ctx, root_dir, current_dir)):
+            if kind == "dir":
+                if stats is not None:
+                    t = time.perf_counter()
+                    value = self._walk(ctx, root_dir, value)
+                    subdir_seconds += time.perf_counter() - t
+                else:
+                    value = self._walk(ctx, root_dir, value)
+            if value is not None:
+                children.append(value)
+
+        if stats is not None:
+            stats.add_dir(current_dir, time.perf_counter() - dir_start - subdir_seconds)
         return structure
 
-    for item in sorted(items):
+    def _iter_walk(self, ctx, root_dir, current_dir):
+        stats = ctx.stats
+        if stats is not None:
+            dir_start = time.perf_counter()
+        # このディレクトリ直下のファイルだけ先に処理する (サブディレクトリは順番が来たら潜る)
+        entries = list(self._resolve(ctx, root_dir, self._list_entries(ctx, root_dir, current_dir)))
+        if stats is not None:
+            stats.add_dir(current_dir, time.perf_counter() - dir_start)
+
+        yield _dir_node(root_dir, current_dir)
+        for kind, value in entries:
+            if kind == "dir":
+                yield from self._iter_walk(ctx, root_dir, value)
+            elif value is not None:
+                if value["type"] == "directory":
+                    value = {k: v for k, v in value.items() if k != "children"}
+                yield value
+
+    def _list_entries(self, ctx, root_dir, current_dir):
+        """
+        current_dir 直下を名前順に (種別, 値) のリストにする。
+        種別: "node" (値はノード) / "dir" / "file" (値はフルパス)
+        """
+        try:
+            if ctx.stats is not None:
+                t = time.perf_counter()
+                items = os.listdir(current_dir)
+                ctx.stats.add("list", time.perf_counter() - t)
+            else:
+                items = os.listdir(current_dir)
+        except PermissionError:
+            if ctx.progress_callback:
+                ctx.progress_callback(f"[アクセス拒否] {current_dir}")
+            return []
+
+        # 前回から変化していないディレクトリは、直下のファイルを stat せずに除外する
+        file_filter = ctx.file_filter
+        skip_files = False
+        if file_filter is not None:
+            rel_path = os.path.relpath(current_dir, root_dir)
+            skip_files = file_filter.can_prune_dir(
+                ctx.root_name_of(root_dir), current_dir, "" if rel_path == "." else rel_path
+            )
+
+        entries = []
+        for item in sorted(items):
+            time.sleep(0)
+            entry = self._classify(ctx, root_dir, current_dir, item)
+            if entry is None:
+                continue
+            if skip_files and entry[0] == "file":
+                file_filter.add_pruned()
+                continue
+            entries.append(entry)
+        return entries
+
+    def _classify(self, ctx, root_dir, current_dir, item):
         full_path = os.path.join(current_dir, item)
-        time.sleep(0)
+        progress_callback = ctx.progress_callback
 
-        # EXCLUDED_DIRS にマッチするフォルダは中身を無視
-        if item in EXCLUDED_DIRS and os.path.isdir(full_path):
+        # excluded_dirs にマッチするフォルダは中身を無視
+        if item in self.excluded_dirs and os.path.isdir(full_path):
             if progress_callback:
                 progress_callback(f"スキップ(フォルダのみ存在表示): {full_path}")
-            skipped_rel_path = os.path.relpath(full_path, root_dir)
-            structure["children"].append({
-                "type": "directory",
-                "name": item,
-                "rel_path": skipped_rel_path,
-                "children": []
-            })
-            continue
-
-        if _is_ignored(item, ignore_patterns):
+            return "node", _excluded_dir_node(root_dir, full_path)
+
+        if self.is_ignored(item):
             if progress_callback:
                 progress_callback(f"スキップ(パターン一致): {full_path}")
-            continue
+            return None
 
         if os.path.isdir(full_path):
-            if progress_callback:
-                progress_callback(f"ディレクトリ: {full_path}")
-            structure["children"].append(
-                _walk_directory(
-                    root_dir,
-                    full_path,
-                    ignore_patterns,
-                    progress_callback,
-                    max_file_size_bytes
-                )
+            return "dir", full_path
+        return "file", full_path
+
+    def _resolve(self, ctx, root_dir, entries):
+        """
+        entries のうちファイルをノードにして、元の順に返す。workers > 1 なら並列に処理する。
+        """
+        executor = self._get_executor() if self.workers > 1 else None
+        if executor is not None:
+            entries = [
+                (kind, executor.submit(self._file_node, ctx, root_dir, value) if kind == "file" else value)
+                for kind, value in entries
+            ]
+        for kind, value in entries:
+            if kind == "dir":
+                if ctx.progress_callback:
+                    ctx.progress_callback(f"ディレクトリ: {value}")
+                yield kind, value
+            elif kind == "file":
+                yield kind, value.result() if executor is not None else self._file_node(ctx, root_dir, value)
+            else:
+                yield kind, value
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="dir2yaml-scan")
+            return self._executor
+
+    def _file_node(self, ctx, root_dir, file_path):
+        stats = ctx.stats
+        if stats is None:
+            return self._read_file_node(ctx, root_dir, file_path)
+
+        start = time.perf_counter()
+        file_data = self._read_file_node(ctx, root_dir, file_path)
+        stats.add_file(file_path, time.perf_counter() - start)
+        return file_data
+
+    def _read_file_node(self, ctx, root_dir, file_path):
+        stats = ctx.stats
+        hardlinks = ctx.hardlinks
+        file_name = os.path.basename(file_path)
+        rel_path = os.path.relpath(file_path, root_dir)
+
+        if ctx.progress_callback:
+            ctx.progress_callback(f"ファイル: {file_path}")
+
+        if stats is None:
+            stat_info = os.stat(file_path)
+        else:
+            t = time.perf_counter()
+            stat_info = os.stat(file_path)
+            stats.add("stat", time.perf_counter() - t)
+
+        # 更新日時/サイズの範囲外なら、ハッシュ計算や読み込みの前に除外
+        if ctx.file_filter is not None and not ctx.file_filter.accepts(stat_info):
+            return None
+
+        # 処理済みの実体(ハードリンク)なら sha256 を再計算しない
+        link_key = linked = None
+        if hardlinks is not None:
+            link_key, linked = hardlinks.lookup(stat_info)
+
+        # 前回の走査から変わっていないファイルはキャッシュを使う
+        cached = None
+        if linked is None and self._cache is not None:
+            cached = self._cache.get(file_path, stat_info)
+            if cached is not None and stats is not None:
+                stats.add_cache_hit()
+
+        file_size = stat_info.st_size
+        skip_by_name = (
+            self._skip_content_match is not None
+            and self._skip_content_match(os.path.normcase(file_name)) is not None
+        )
+        skip_by_size = (
+            not skip_by_name
+            and self.max_file_size_bytes is not None
+            and file_size > self.max_file_size_bytes
+        )
+
+        # 内容も読む場合は、sha256 の計算とデコードを1回の読み込みで行う
+        read_result = None
+        if linked is not None:
+            file_hash = linked["sha256"]
+        elif cached is not None:
+            file_hash = cached[1]
+        elif not skip_by_name and not skip_by_size:
+            read_result = self._read_text(
+                file_path, stats, with_hash=self.digest is not None, content_store=ctx.content_store, size=file_size
             )
+            file_hash = read_result[0]
+        elif self.digest is None:
+            file_hash = None
+        elif stats is None:
+            file_hash = _calc_sha256(file_path)
         else:
-            structure["children"].append(
-                _process_file(
-                    root_dir,
-                    full_path,
-                    max_file_size_bytes,
-                    progress_callback
+            t = time.perf_counter()
+            file_hash = _calc_sha256(file_path)
+            stats.add("hash", time.perf_counter() - t)
+            if file_hash is not None:
+                stats.add_bytes(file_size)
+
+        file_data = {
+            "type": "file",
+            "name": file_name,
+            "rel_path": rel_path,
+            "size": file_size,
+            "mtime": stat_info.st_mtime,
+            "sha256": file_hash,
+            "content": None
+        }
+
+        if skip_by_name:
+            file_data["content"] = SKIPPED_BY_NAME
+            if link_key is not None and linked is None:
+                hardlinks.remember(link_key, ctx.root_name_of(root_dir), rel_path, file_hash, None)
+            self._cache_put(file_path, stat_info, file_hash, cached)
+            return file_data
+
+        if skip_by_size:
+            file_data["content"] = SKIPPED_BY_SIZE
+            self._cache_put(file_path, stat_info, file_hash, cached)
+            return file_data
+
+        # 内容の判定(テキスト/バイナリ)も実体が同じなら使い回す
+        # (名前によるスキップだけはパスごとに判定が変わるので、上で済ませておく)
+        if linked is not None and linked["content"] is not None:
+            hardlinks.add_reuse()
+            if stats is not None:
+                stats.add_hardlink_reuse()
+            if hardlinks.emit_refs:
+                del file_data["content"]
+                file_data["hardlink_of"] = linked["path"]
+                file_data["content"] = None
+            elif linked["encoding"] is None:
+                file_data["content"] = linked["content"]
+            else:
+                _set_text(file_data, linked["content"], linked["encoding"])
+            return file_data
+
+        if cached is not None and cached[2] is not None:
+            text_data, encoding, nbytes = cached[2], cached[5], cached[3]
+        else:
+            if read_result is None:
+                # ハッシュはリンク元/キャッシュの値を使い、内容だけ読む
+                read_result = self._read_text(
+                    file_path, stats, with_hash=False, content_store=ctx.content_store, size=file_size
                 )
+            _, text_data, encoding, nbytes = read_result
+            if isinstance(text_data, SpilledContent):
+                # 一時ファイルは走査ごとに閉じるので、内容はキャッシュしない
+                self._cache_put(file_path, stat_info, file_hash, cached)
+            elif text_data is not None:
+                self._cache_put(file_path, stat_info, file_hash, cached, text_data, nbytes, encoding)
+
+        if text_data is None or text_data == SKIPPED_BINARY:
+            file_data["content"] = SKIPPED_BINARY
+            encoding = None
+        elif isinstance(text_data, SpilledContent):
+            _set_text(file_data, text_data, encoding)
+        elif ctx.content_store is not None:
+            _set_text(file_data, ctx.content_store.put(text_data, size_hint=nbytes), encoding)
+        else:
+            _set_text(file_data, text_data, encoding)
+
+        if link_key is not None:
+            hardlinks.remember(
+                link_key, ctx.root_name_of(root_dir), rel_path, file_hash, file_data["content"], encoding
             )
+        return file_data
 
-    return structure
+    def _read_text(self, file_path, stats, with_hash, content_store=None, size=0):
+        """
+        戻り値: (sha256, デコードした内容, 文字コード, バイト数)。
+        バイナリなら内容は SKIPPED_BINARY、読み込めなければ (None, None, None, 0) (こちらはキャッシュしない)
+        content_store の上限に収まらない大きさ (size) なら、デコードしながら一時ファイルへ書き出し、内容は SpilledContent。
+        sha256 を一緒に計算した場合、その時間も "read" に含める。
+        """
+        if stats is not None:
+            t = time.perf_counter()
+        result = None, None, None, 0
+        writer = content_store.spill_writer(size) if content_store is not None else None
+        try:
+            digest, text, encoding, nbytes = read_text(
+                file_path, self.encodings, self.normalize_newlines, with_hash=with_hash, out=writer
+            )
+            if stats is not None:
+                stats.add_bytes(nbytes)
+            if text is None:
+                result = digest, SKIPPED_BINARY, None, 0
+            else:
+                if writer is not None:
+                    text, writer = writer.commit(), None
+                result = digest, text, encoding, nbytes
+        except Exception:
+            pass
+        finally:
+            if writer is not None:
+                writer.abort()
+        if stats is not None:
+            stats.add("read", time.perf_counter() - t)
+        return result
 
+    def _cache_put(self, file_path, stat_info, file_hash, cached, content=None, nbytes=0, encoding=None):
+        if self._cache is not None and (cached is None or content is not None):
+            self._cache.put(file_path, stat_info, file_hash, content, nbytes, encoding)
 
-def _process_file(
-    root_dir,
-    file_path,
-    max_file_size_bytes,
-    progress_callback
-):
-    file_name = os.path.basename(file_path)
-    rel_path = os.path.relpath(file_path, root_dir)
-
-    if progress_callback:
-        progress_callback(f"ファイル: {file_path}")
-
-    stat_info = os.stat(file_path)
-    file_size = stat_info.st_size
-    mtime = stat_info.st_mtime
-    file_hash = _calc_sha256(file_path)
-
-    file_data = {
-        "type": "file",
-        "name": file_name,
-        "rel_path": rel_path,
-        "size": file_size,
-        "mtime": mtime,
-        "sha256": file_hash,
-        "content": None
+
+class _ScanContext:
+    """
+    1回の呼び出しの中だけで使う状態。Scanner 本体には持たせない (スレッド間で共有しないため)。
+    """
+
+    __slots__ = ("progress_callback", "stats", "content_store", "file_filter", "hardlinks", "root_name")
+
+    def __init__(self, progress_callback, stats, content_store, file_filter, hardlinks):
+        self.progress_callback = progress_callback
+        self.stats = stats
+        self.content_store = content_store
+        self.file_filter = file_filter
+        self.hardlinks = hardlinks
+        # 走査中のルートの名前 (unique_root_names で重複を避けたもの)
+        self.root_name = None
+
+    def root_name_of(self, root_dir):
+        if self.root_name is not None:
+            return self.root_name
+        return os.path.basename(os.path.normpath(root_dir))
+
+
+class _FileCache:
+    """
+    パスごとに (stat の識別子, sha256, 内容, バイト数, -, 文字コード) を覚えておく LRU キャッシュ。
+    内容の文字数 + 1件あたりの固定分の合計が max_bytes を超えたら古いものから捨てる。
+    """
+
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, stat_info):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != _stat_key(stat_info):
+                return None
+            self._entries.move_to_end(path)
+            return entry
+
+    def put(self, path, stat_info, digest, content, nbytes, encoding=None):
+        cost = self.ENTRY_OVERHEAD + (len(content) if content is not None else 0)
+        if cost > self.max_bytes:
+            # 内容が大きすぎる場合は sha256 だけ覚える
+            content, nbytes, cost, encoding = None, 0, self.ENTRY_OVERHEAD, None
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= old[4]
+            self._entries[path] = (_stat_key(stat_info), digest, content, nbytes, cost, encoding)
+            self._bytes += cost
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[4]
+
+
+def _stat_key(stat_info):
+    return (stat_info.st_dev, stat_info.st_ino, stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ctime_ns)
+
+
+def _dir_node(root_dir, current_dir):
+    rel_path = os.path.relpath(current_dir, root_dir)  # root_dirからの相対パス
+    if rel_path == ".":
+        rel_path = ""
+    dir_name = os.path.basename(os.path.normpath(current_dir))
+    return {
+        "type": "directory",
+        "name": dir_name if rel_path else ".",
+        "rel_path": rel_path
     }
 
-    # スキップ対象例
-    skip_by_name = [".env", ".htpasswd"]
-    if file_name.endswith(".log"):
-        skip_by_name.append(file_name)
 
-    if file_name in skip_by_name:
-        file_data["content"] = "[SKIPPED by name]"
-        return file_data
+def _set_text(file_data, content, encoding):
+    # encoding は content の直前に置く
+    del file_data["content"]
+    file_data["encoding"] = encoding
+    file_data["content"] = content
 
-    if max_file_size_bytes is not None and file_size > max_file_size_bytes:
-        file_data["content"] = "[SKIPPED due to size]"
-        return file_data
 
-    try:
-        with open(file_path, "rb") as fb:
-            raw_data = fb.read()
-            if b"\0" in raw_data:
-                file_data["content"] = "[SKIPPED or BINARY]"
-            else:
-                text_data = raw_data.decode("utf-8", errors="replace")
-                file_data["content"] = text_data
-    except Exception:
-        file_data["content"] = "[SKIPPED or BINARY]"
+def _excluded_dir_node(root_dir, full_path):
+    return {
+        "type": "directory",
+        "name": os.path.basename(full_path),
+        "rel_path": os.path.relpath(full_path, root_dir),
+        "children": []
+    }
+
+
+def _compile_patterns(patterns):
+    """
+    fnmatch のパターンを1つの正規表現にまとめる。パターンが無ければ None。
+    """
+    if not patterns:
+        return None
+    return re.compile(
+        "|".join(f"(?:{fnmatch.translate(os.path.normcase(p))})" for p in patterns)
+    ).match
+
+
+class HardlinkTracker:
+    """
+    走査中に (st_dev, st_ino) ごとの処理結果を覚えておき、
+    同じ実体を指すハードリンクの sha256 計算と内容の読み込みを省く。
+    リンク数が1のファイルは覚えない。
+    """
+
+    def __init__(self, emit_refs=False):
+        self.emit_refs = emit_refs
+        self.reused = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, stat_info):
+        """
+        戻り値: (実体のキー, 処理済みの結果 or None)。追跡対象外なら (None, None)
+        """
+        if stat_info.st_nlink < 2:
+            return None, None
+        key = (stat_info.st_dev, stat_info.st_ino)
+        with self._lock:
+            return key, self._seen.get(key)
+
+    def remember(self, key, root_name, rel_path, sha256, content, encoding=None):
+        with self._lock:
+            # 並列に処理した場合は先に覚えたほうを残す (内容の無いものは上書きする)
+            old = self._seen.get(key)
+            if old is None or old["content"] is None:
+                self._seen[key] = {
+                    "path": make_index_key(root_name, rel_path),
+                    "sha256": sha256,
+                    "content": content,
+                    "encoding": encoding,
+                }
+
+    def add_reuse(self):
+        with self._lock:
+            self.reused += 1
+
+
+# StatFilter の条件としてプロファイルに書ける項目
+STAT_FILTER_KEYS = ("modified_since", "modified_before", "min_size", "max_size")
 
-    return file_data
+
+class StatFilter:
+    """
+    stat の情報だけで判定できるファイルの絞り込み。
+    modified_since / modified_before: 更新日時の範囲 (UNIX時刻 or ISO 8601 文字列)
+    min_size / max_size:              サイズの範囲[byte] (max_file_size_bytes と違い、ファイル自体を出力しない)
+    previous_index:                   前回スナップショットのインデックス(.idx)のパス。
+        modified_since と併用すると、mtime が modified_since より古く前回も存在したディレクトリは
+        直下のファイルを stat せずに除外する。ファイルの上書き保存はディレクトリの mtime を
+        変えないため、この場合の変更は拾えない点に注意。
+    """
+
+    def __init__(
+        self,
+        modified_since=None,
+        modified_before=None,
+        min_size=None,
+        max_size=None,
+        previous_index=None
+    ):
+        self.modified_since = parse_time(modified_since)
+        self.modified_before = parse_time(modified_before)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.excluded = 0
+        self.pruned = 0
+        self._known_dirs = None
+        self._lock = threading.Lock()
+        if previous_index and self.modified_since is not None:
+            from .snapshot_index import load_indexed_dirs
+            self._known_dirs = load_indexed_dirs(previous_index)
+
+    def accepts(self, stat_info):
+        mtime = stat_info.st_mtime
+        size = stat_info.st_size
+        if (
+            (self.modified_since is not None and mtime < self.modified_since)
+            or (self.modified_before is not None and mtime >= self.modified_before)
+            or (self.min_size is not None and size < self.min_size)
+            or (self.max_size is not None and size > self.max_size)
+        ):
+            with self._lock:
+                self.excluded += 1
+            return False
+        return True
+
+    def add_pruned(self):
+        with self._lock:
+            self.pruned += 1
+
+    def merge(self, other):
+        """
+        別プロセスで使った StatFilter の件数を足し込む。
+        """
+        with self._lock:
+            self.excluded += other.excluded
+            self.pruned += other.pruned
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def can_prune_dir(self, root_name, dir_path, rel_path):
+        if self._known_dirs is None:
+            return False
+        if make_index_key(root_name, rel_path) not in self._known_dirs:
+            return False
+        try:
+            return os.stat(dir_path).st_mtime < self.modified_since
+        except OSError:
+            return False
+
+    def summary(self):
+        return f"stat による除外: {self.excluded}件, ディレクトリ単位の除外: {self.pruned}件"
+
+
+def parse_time(value):
+    """
+    UNIX時刻(数値) / ISO 8601 文字列 ("2025-01-31", "2025-01-31T09:00:00") を UNIX時刻にする。
+    タイムゾーンの無い文字列はローカル時刻とみなす。
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    import datetime
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
 
 
 def _calc_sha256(file_path):
+    import hashlib  # 起動時間短縮のため、実際にハッシュ計算するときに読み込む
     try:
         sha256_hash = hashlib.sha256()
         with open(file_path, "rb") as f:
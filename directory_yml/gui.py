@@ -1,33 +1,59 @@
+import codecs
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox, simpledialog
 from tkinter import ttk
 import threading
 import queue
-import pyperclip
 import os
 import datetime
+import shutil
+import tempfile
 
 from .config_manager import ConfigManager
-from .file_processing import collect_directory_structures
-from .yml_generator import generate_yaml
-
-DEFAULT_IGNORE_PATTERNS = [".env", ".htpasswd", "*.log"]
+from .file_processing import (
+    collect_directory_structures, DEFAULT_IGNORE_PATTERNS, STAT_FILTER_KEYS, StatFilter
+)
+from .yml_generator import write_yaml
+from .snapshot_index import index_path_for
+from .scan_stats import ScanStats
+from .content_store import ContentSpillStore
+from .text_decoding import DEFAULT_ENCODINGS
+
+# これを超えるYAMLはクリップボードへコピーする前に「保存」を勧める
+CLIPBOARD_LIMIT_BYTES = 20 * 1024 * 1024
+# 保存/コピー時に一度に読み書きする量
+IO_CHUNK_BYTES = 1024 * 1024
+# プレビュー1ページ分の最大バイト数
+PREVIEW_PAGE_BYTES = 64 * 1024
+# プロファイルの変更をまとめて config.json へ書き出すまでの秒数
+CONFIG_SAVE_DELAY = 1.0
 
 class DirectoryYmlGUI:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Dir2YAML")
-        self.root.geometry("780x730")
+        self.root.geometry("780x900")
 
         self.progress_queue = queue.Queue()
-        self._yaml_result = ""
-
-        self.config_manager = ConfigManager()
+        # ワーカースレッドからメインスレッドで実行してほしい処理 (ウィジェット操作)
+        self.ui_queue = queue.Queue()
+        # 生成したYAMLは一時ファイルに書き出し、メモリには持たない (インデックスも同じ場所に .idx)
+        self._yaml_path = None
+        self._yaml_size = 0
+        self._task_running = False
+        # プレビューで表示中のページと、表示済みページの開始位置[byte]
+        self._preview_page = 0
+        self._preview_starts = [0]
+
+        self.config_manager = ConfigManager(save_delay=CONFIG_SAVE_DELAY)
         self.active_profile_name = self.config_manager.get_active_profile_name()
 
         # ロードしたprofile_dataを保持(比較用)
         self.loaded_profile_data = {}
 
+        # UIに項目の無い設定 (更新日時/サイズの絞り込み)。config.json で指定し、保存時はそのまま残す
+        self.stat_filter_options = {}
+
         # ディレクトリ一覧などUI用
         self.directory_list = []
 
@@ -100,6 +126,30 @@ class DirectoryYmlGUI:
         )
         self.file_size_spin.pack(side=tk.LEFT, padx=5)
 
+        tk.Label(misc_frame, text="内容のメモリ上限[byte] (0=無制限): ").pack(side=tk.LEFT, padx=(15, 0))
+        self.content_budget_spin = tk.Spinbox(
+            misc_frame, from_=0, to=100_000_000_000, increment=1_000_000, width=12
+        )
+        self.content_budget_spin.pack(side=tk.LEFT, padx=5)
+
+        self.hardlink_refs_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            misc_frame, text="ハードリンクは参照で出力", variable=self.hardlink_refs_var
+        ).pack(side=tk.LEFT, padx=(15, 0))
+
+        # ========== 文字コード ==========
+        encoding_frame = tk.LabelFrame(main_frame, text="文字コード", padx=10, pady=10)
+        encoding_frame.pack(fill="x", pady=5)
+
+        tk.Label(encoding_frame, text="候補(カンマ区切り、先頭から順に試す): ").pack(side=tk.LEFT)
+        self.encodings_entry = tk.Entry(encoding_frame, width=30)
+        self.encodings_entry.pack(side=tk.LEFT, padx=5)
+
+        self.normalize_newlines_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            encoding_frame, text="改行をLFに統一", variable=self.normalize_newlines_var
+        ).pack(side=tk.LEFT, padx=(15, 0))
+
         # ========== プロジェクト名 + YAML生成など ==========
         action_frame = tk.Frame(main_frame)
         action_frame.pack(fill="x", pady=10)
@@ -146,16 +196,41 @@ class DirectoryYmlGUI:
         )
         self.save_button.pack(side=tk.LEFT, padx=5)
 
+        # 保存/コピーの進捗
+        self.task_progress = ttk.Progressbar(main_frame, mode="determinate", maximum=100)
+        self.task_progress.pack(fill="x", pady=(0, 5))
+
+        # ========== Preview ==========
+        preview_frame = tk.LabelFrame(main_frame, text="プレビュー", padx=10, pady=10)
+        preview_frame.pack(fill="both", expand=True, pady=5)
+
+        preview_nav = tk.Frame(preview_frame)
+        preview_nav.pack(fill="x")
+        self.preview_prev_button = tk.Button(
+            preview_nav, text="◀ 前へ", command=lambda: self.show_preview_page(self._preview_page - 1)
+        )
+        self.preview_prev_button.pack(side=tk.LEFT)
+        self.preview_next_button = tk.Button(
+            preview_nav, text="次へ ▶", command=lambda: self.show_preview_page(self._preview_page + 1)
+        )
+        self.preview_next_button.pack(side=tk.LEFT, padx=5)
+        self.preview_label = tk.Label(preview_nav, text="")
+        self.preview_label.pack(side=tk.LEFT, padx=10)
+
+        self.preview_text = scrolledtext.ScrolledText(preview_frame, width=80, height=8, state="disabled")
+        self.preview_text.pack(fill="both", expand=True)
+
         # ========== Progress Log ==========
         progress_frame = tk.LabelFrame(main_frame, text="Progress Log", padx=10, pady=10)
         progress_frame.pack(fill="both", expand=True, pady=5)
 
-        self.progress_text = scrolledtext.ScrolledText(progress_frame, width=80, height=10)
+        self.progress_text = scrolledtext.ScrolledText(progress_frame, width=80, height=8)
         self.progress_text.pack(fill="both", expand=True)
 
         # 非同期ログ監視 & コピー保存無効
         self.check_progress_queue()
         self.disable_copy_save_buttons()
+        self._reset_preview()
 
         # ウィンドウ×押下イベント
         self.root.protocol("WM_DELETE_WINDOW", self._on_window_close)
@@ -231,9 +306,13 @@ class DirectoryYmlGUI:
             "project_name": self._get_project_name_entry_str(),
             "directories": self.directory_list,
             "ignore_patterns": self.get_user_ignore_patterns(),
-            "max_file_size_bytes": int(self.file_size_spin.get())
+            "max_file_size_bytes": int(self.file_size_spin.get()),
+            "content_budget_bytes": int(self.content_budget_spin.get()),
+            "hardlink_refs": self.hardlink_refs_var.get(),
+            "encodings": self.get_encodings(),
+            "normalize_newlines": self.normalize_newlines_var.get()
         }
-        self.config_manager.save_profile_data(profile_name, data)
+        self.config_manager.save_profile_data(profile_name, {**data, **self.stat_filter_options})
         self.active_profile_name = profile_name
         self.loaded_profile_data = data
 
@@ -291,7 +370,12 @@ class DirectoryYmlGUI:
         self.directory_list = pd.get("directories", [])
         ignore_list = pd.get("ignore_patterns", [])
         max_file_size = pd.get("max_file_size_bytes", 500000)
+        content_budget = pd.get("content_budget_bytes", 0)
+        hardlink_refs = pd.get("hardlink_refs", False)
+        encodings = pd.get("encodings") or list(DEFAULT_ENCODINGS)
+        normalize_newlines = pd.get("normalize_newlines", False)
         project_name = pd.get("project_name", "")
+        self.stat_filter_options = {k: pd[k] for k in STAT_FILTER_KEYS if pd.get(k) not in (None, "")}
 
         self.ignore_entry.delete(0, tk.END)
         if ignore_list:
@@ -300,6 +384,14 @@ class DirectoryYmlGUI:
         self.file_size_spin.delete(0, tk.END)
         self.file_size_spin.insert(0, str(max_file_size))
 
+        self.content_budget_spin.delete(0, tk.END)
+        self.content_budget_spin.insert(0, str(content_budget))
+        self.hardlink_refs_var.set(hardlink_refs)
+
+        self.encodings_entry.delete(0, tk.END)
+        self.encodings_entry.insert(0, ",".join(encodings))
+        self.normalize_newlines_var.set(normalize_newlines)
+
         self.update_dir_list_display()
 
         # プロジェクト名(placeholder対応)
@@ -310,7 +402,11 @@ class DirectoryYmlGUI:
             "project_name": project_name,
             "directories": list(self.directory_list),
             "ignore_patterns": list(ignore_list),
-            "max_file_size_bytes": max_file_size
+            "max_file_size_bytes": max_file_size,
+            "content_budget_bytes": content_budget,
+            "hardlink_refs": hardlink_refs,
+            "encodings": list(encodings),
+            "normalize_newlines": normalize_newlines
         }
         self._log_progress(f"プロファイル '{profile_name}' を読み込みました。")
 
@@ -342,13 +438,19 @@ class DirectoryYmlGUI:
             "project_name": self._get_project_name_entry_str(),
             "directories": list(self.directory_list),
             "ignore_patterns": self.get_user_ignore_patterns(),
-            "max_file_size_bytes": int(self.file_size_spin.get())
+            "max_file_size_bytes": int(self.file_size_spin.get()),
+            "content_budget_bytes": int(self.content_budget_spin.get()),
+            "hardlink_refs": self.hardlink_refs_var.get(),
+            "encodings": self.get_encodings(),
+            "normalize_newlines": self.normalize_newlines_var.get()
         }
         return current_data != self.loaded_profile_data
 
     def _on_window_close(self):
         if not self.confirm_unsaved_changes():
             return
+        self._discard_yaml_file()
+        self.config_manager.close()
         self.root.destroy()
 
     # -------------------------------------------------------------------------
@@ -407,18 +509,30 @@ class DirectoryYmlGUI:
         arr = [x.strip() for x in txt.split(",") if x.strip()]
         return arr
 
+    def get_encodings(self):
+        txt = self.encodings_entry.get().strip()
+        return [x.strip() for x in txt.split(",") if x.strip()]
+
     # -------------------------------------------------------------------------
     # YAML生成
     # -------------------------------------------------------------------------
     def start_generate_yaml(self):
+        if self._task_running:
+            self._log_progress("実行中の処理の完了後に再度実行してください。")
+            return
         self.progress_text.delete("1.0", tk.END)
         if not self.directory_list:
             self._log_progress("ターゲットディレクトリが登録されていません。")
             return
+        for encoding in self.get_encodings():
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                self._log_progress(f"未対応の文字コードです: {encoding}")
+                return
 
-        t = threading.Thread(target=self._generate_yaml_thread)
-        t.daemon = True
-        t.start()
+        # 生成中にコピー/保存/クリアが走ると、完了時に差し替える一時ファイルを読んでいる途中で削除してしまう
+        self._start_task(self._generate_yaml_thread)
 
     def _generate_yaml_thread(self):
         self._log_progress("走査を開始します...")
@@ -432,21 +546,52 @@ class DirectoryYmlGUI:
             project_name = self._generate_default_project_name(directories)
 
         max_file_size = int(self.file_size_spin.get())
+        content_budget = int(self.content_budget_spin.get())
+        hardlink_refs = self.hardlink_refs_var.get()
+        encodings = self.get_encodings()
+        normalize_newlines = self.normalize_newlines_var.get()
         combined_ignore = DEFAULT_IGNORE_PATTERNS + user_ignore_patterns
-
-        structure_data = collect_directory_structures(
-            directories,
-            combined_ignore,
-            progress_callback=self._progress_callback,
-            max_file_size_bytes=max_file_size
-        )
-        self._log_progress("YAMLの生成を開始します...")
-
-        yaml_text = generate_yaml(structure_data, project_name)
-        self._yaml_result = yaml_text
-
+        stats = ScanStats(top_n=3)
+        file_filter = StatFilter(**self.stat_filter_options) if self.stat_filter_options else None
+
+        with ContentSpillStore(content_budget) as content_store:
+            structure_data = collect_directory_structures(
+                directories,
+                combined_ignore,
+                progress_callback=self._progress_callback,
+                max_file_size_bytes=max_file_size,
+                stats=stats,
+                content_store=content_store,
+                hardlink_refs=hardlink_refs,
+                file_filter=file_filter,
+                encodings=encodings,
+                normalize_newlines=normalize_newlines
+            )
+            self._log_progress("YAMLの生成を開始します...")
+
+            # 巨大な結果でも文字列として持たないよう、一時ファイルへ逐次書き出す
+            fd, yaml_path = tempfile.mkstemp(prefix="dir2yaml_", suffix=".yml")
+            os.close(fd)
+            try:
+                write_yaml(structure_data, project_name, yaml_path, stats=stats)
+            except BaseException:
+                # 書きかけの一時ファイル (とインデックス) を残さない
+                for path in (yaml_path, index_path_for(yaml_path)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                raise
+            del structure_data
+
+        self.ui_queue.put(lambda: self._set_yaml_file(yaml_path))
         self._log_progress("YAML生成が完了しました。")
-        self.enable_copy_save_buttons()
+        self._log_progress(stats.summary())
+        self._log_progress(content_store.summary())
+        if file_filter is not None:
+            self._log_progress(file_filter.summary())
+        for path, seconds in stats.slowest_files:
+            self._log_progress(f"  遅いファイル: {path} ({seconds:.2f}s)")
 
     def _generate_default_project_name(self, directories):
         if not directories:
@@ -466,6 +611,13 @@ class DirectoryYmlGUI:
             else:
                 self.progress_text.insert(tk.END, msg + "\n")
                 self.progress_text.see(tk.END)
+        while True:
+            try:
+                func = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            else:
+                func()
         self.root.after(100, self.check_progress_queue)
 
     def _progress_callback(self, message):
@@ -478,19 +630,73 @@ class DirectoryYmlGUI:
     # クリア / コピー / 保存
     # -------------------------------------------------------------------------
     def clear_yaml_result(self):
-        self._yaml_result = ""
+        if self._task_running:
+            self._log_progress("実行中の処理の完了後にクリアしてください。")
+            return
+        self._discard_yaml_file()
         self.disable_copy_save_buttons()
+        self._reset_preview()
         self.progress_text.delete("1.0", tk.END)
         self._log_progress("YAMLをクリアしました。")
 
+    def _set_yaml_file(self, yaml_path):
+        """
+        生成した一時ファイルを結果として採用する (メインスレッドで呼ぶ)。
+        """
+        self._discard_yaml_file()
+        self._yaml_path = yaml_path
+        self._yaml_size = os.path.getsize(yaml_path)
+        self._reset_preview()
+        self.show_preview_page(0)
+
+    def _discard_yaml_file(self):
+        if self._yaml_path is None:
+            return
+        for path in (self._yaml_path, index_path_for(self._yaml_path)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._yaml_path = None
+        self._yaml_size = 0
+
     def copy_to_clipboard(self):
-        if not self._yaml_result:
+        if self._yaml_path is None or self._task_running:
             return
-        pyperclip.copy(self._yaml_result)
+        if self._yaml_size > CLIPBOARD_LIMIT_BYTES:
+            answer = messagebox.askyesnocancel(
+                "サイズの確認",
+                f"YAMLが {self._yaml_size / (1024 * 1024):.1f}MB あります。\n"
+                "クリップボードへのコピーには時間がかかり、貼り付け先で扱えない場合があります。\n\n"
+                "代わりにファイルへ保存しますか?\n"
+                "(「いいえ」でそのままコピーします)"
+            )
+            if answer is None:
+                return
+            if answer:
+                self.save_to_file()
+                return
+        self._start_task(self._copy_thread, self._yaml_path, self._yaml_size)
+
+    def _copy_thread(self, yaml_path, total):
+        # pyperclip はコピー時にだけ読み込む (起動時間短縮)
+        import pyperclip
+        self._log_progress("YAMLを読み込んでいます...")
+        parts = []
+        done = 0
+        with open(yaml_path, "rb") as f:
+            for chunk in iter(lambda: f.read(IO_CHUNK_BYTES), b""):
+                parts.append(chunk)
+                done += len(chunk)
+                self._report_task_progress(done, total)
+        text = b"".join(parts).decode("utf-8")
+        del parts
+        self._log_progress("クリップボードへ転送しています...")
+        pyperclip.copy(text)
         self._log_progress("YAMLをクリップボードにコピーしました。")
 
     def save_to_file(self):
-        if not self._yaml_result:
+        if self._yaml_path is None or self._task_running:
             return
 
         # プロジェクト名 or fallback
@@ -505,12 +711,120 @@ class DirectoryYmlGUI:
             filetypes=[("YAML files", "*.yml"), ("All files", "*.*")]
         )
         if file_path:
+            self._start_task(self._save_thread, self._yaml_path, self._yaml_size, file_path)
+
+    def _save_thread(self, yaml_path, total, file_path):
+        # 一時ファイルをそのまま複製する (インデックスのバイトオフセットもそのまま使える)
+        self._log_progress(f"YAMLを保存しています: {file_path}")
+        tmp_path = file_path + ".tmp"
+        done = 0
+        try:
+            with open(yaml_path, "rb") as src, open(tmp_path, "wb") as dst:
+                for chunk in iter(lambda: src.read(IO_CHUNK_BYTES), b""):
+                    dst.write(chunk)
+                    done += len(chunk)
+                    self._report_task_progress(done, total)
+            with open(index_path_for(yaml_path), "rb") as src, open(index_path_for(tmp_path), "wb") as dst:
+                shutil.copyfileobj(src, dst, IO_CHUNK_BYTES)
+            os.replace(index_path_for(tmp_path), index_path_for(file_path))
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            # 書きかけの一時ファイルを保存先に残さない
+            for path in (tmp_path, index_path_for(tmp_path)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+        self._log_progress(f"YAMLを保存しました: {file_path}")
+
+    def _start_task(self, target, *args):
+        """
+        YAML生成/保存/コピーをワーカースレッドで実行する。実行中は生成・コピー・保存・クリアを受け付けない。
+        """
+        self._task_running = True
+        self.disable_copy_save_buttons()
+        self.generate_button.config(state="disabled")
+        self.clear_button.config(state="disabled")
+        self.task_progress.config(value=0)
+
+        def run():
             try:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(self._yaml_result)
-                self._log_progress(f"YAMLを保存しました: {file_path}")
+                target(*args)
             except Exception as e:
-                self._log_progress(f"保存中にエラーが発生しました: {e}")
+                self._log_progress(f"処理中にエラーが発生しました: {e}")
+            finally:
+                self.ui_queue.put(self._finish_task)
+
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+
+    def _finish_task(self):
+        self._task_running = False
+        self.task_progress.config(value=0)
+        self.generate_button.config(state="normal")
+        self.clear_button.config(state="normal")
+        if self._yaml_path is not None:
+            self.enable_copy_save_buttons()
+
+    def _report_task_progress(self, done, total):
+        percent = 100 * done / total if total else 100
+        self.ui_queue.put(lambda: self.task_progress.config(value=percent))
+
+    # -------------------------------------------------------------------------
+    # プレビュー (一時ファイルから1ページずつ読む)
+    # -------------------------------------------------------------------------
+    def show_preview_page(self, page):
+        if self._yaml_path is None or page < 0 or page >= len(self._preview_starts):
+            return
+        start = self._preview_starts[page]
+        try:
+            with open(self._yaml_path, "rb") as f:
+                f.seek(start)
+                data = f.read(PREVIEW_PAGE_BYTES)
+        except OSError as e:
+            self._log_progress(f"プレビューを読み込めません: {e}")
+            return
+
+        end = start + len(data)
+        if end < self._yaml_size:
+            # ページは行の区切りで終える (1行がページより長ければ文字の区切り)
+            cut = data.rfind(b"\n") + 1
+            if cut <= 0:
+                cut = len(data)
+                while cut > 0 and data[cut - 1] & 0xC0 == 0x80:
+                    cut -= 1
+                if cut > 0 and data[cut - 1] >= 0xC0:
+                    cut -= 1  # 途中で切れた文字は次のページへ
+                cut = cut or len(data)
+            data = data[:cut]
+            end = start + cut
+            if page + 1 == len(self._preview_starts):
+                self._preview_starts.append(end)
+
+        self._preview_page = page
+        self.preview_text.config(state="normal")
+        self.preview_text.delete("1.0", tk.END)
+        self.preview_text.insert("1.0", data.decode("utf-8", errors="replace"))
+        self.preview_text.config(state="disabled")
+
+        has_next = page + 1 < len(self._preview_starts)
+        self.preview_prev_button.config(state="normal" if page > 0 else "disabled")
+        self.preview_next_button.config(state="normal" if has_next else "disabled")
+        self.preview_label.config(
+            text=f"{page + 1} ページ目 ({start:,} - {end:,} / {self._yaml_size:,} byte)"
+        )
+
+    def _reset_preview(self):
+        self._preview_page = 0
+        self._preview_starts = [0]
+        self.preview_text.config(state="normal")
+        self.preview_text.delete("1.0", tk.END)
+        self.preview_text.config(state="disabled")
+        self.preview_prev_button.config(state="disabled")
+        self.preview_next_button.config(state="disabled")
+        self.preview_label.config(text="")
 
     # -------------------------------------------------------------------------
     # ボタン有効/無効
@@ -0,0 +1,183 @@
+"""
+走査/YAML生成の計測用オブジェクト。
+collect_directory_structures() / generate_yaml() に stats=ScanStats() を渡したときだけ計測する
+(渡さない場合は計測処理を一切通らない)。
+"""
+
+import heapq
+import io
+import threading
+
+
+class ScanStats:
+    """
+    フェーズごとの回数・累積時間、読み込みバイト数、遅いファイル/ディレクトリの上位を集計する。
+    Scanner の workers > 1 では複数スレッドから呼ばれるため、集計はロックの中で行う。
+
+    フェーズ名:
+      list      ディレクトリの列挙 (os.listdir)
+      stat      os.stat
+      hash      sha256 計算 (内容を読まないファイルの分)
+      read      ファイル内容の読み込みとデコード (同じ読み込みで計算した sha256 を含む)
+      serialize YAMLテキストの生成
+      write     ファイルへの書き出し
+    """
+
+    PHASES = ("list", "stat", "hash", "read", "serialize", "write")
+
+    def __init__(self, top_n=10, profile=False):
+        self.top_n = top_n
+        self.phases = {name: {"count": 0, "seconds": 0.0} for name in self.PHASES}
+        self.files = 0
+        self.dirs = 0
+        self.bytes_read = 0
+        self.hardlinks_reused = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+        self._slow_files = []
+        self._slow_dirs = []
+        self._profiler = None
+        self._profile_enabled = profile
+
+    # -----------------------------
+    # 計測 (file_processing / yml_generator から呼ばれる)
+    # -----------------------------
+    def add(self, phase, seconds, count=1):
+        with self._lock:
+            entry = self.phases[phase]
+            entry["count"] += count
+            entry["seconds"] += seconds
+
+    def add_file(self, path, seconds):
+        with self._lock:
+            self.files += 1
+            _push_top(self._slow_files, self.top_n, seconds, path)
+
+    def add_dir(self, path, seconds):
+        # seconds はそのディレクトリ自身 (列挙と直下のファイル) の時間。サブディレクトリの分は含めない
+        with self._lock:
+            self.dirs += 1
+            _push_top(self._slow_dirs, self.top_n, seconds, path)
+
+    def add_bytes(self, nbytes):
+        with self._lock:
+            self.bytes_read += nbytes
+
+    def add_hardlink_reuse(self):
+        with self._lock:
+            self.hardlinks_reused += 1
+
+    def add_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def merge(self, other):
+        """
+        別の ScanStats (別プロセスで計測したものなど) の結果を足し込む。cProfile の結果は対象外。
+        """
+        with self._lock:
+            for name, v in other.phases.items():
+                self.phases[name]["count"] += v["count"]
+                self.phases[name]["seconds"] += v["seconds"]
+            self.files += other.files
+            self.dirs += other.dirs
+            self.bytes_read += other.bytes_read
+            self.hardlinks_reused += other.hardlinks_reused
+            self.cache_hits += other.cache_hits
+            for seconds, path in other._slow_files:
+                _push_top(self._slow_files, self.top_n, seconds, path)
+            for seconds, path in other._slow_dirs:
+                _push_top(self._slow_dirs, self.top_n, seconds, path)
+
+    def __getstate__(self):
+        # ロックと cProfile はプロセス間で受け渡せないので除く
+        state = dict(self.__dict__)
+        state["_lock"] = None
+        state["_profiler"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def start_profile(self):
+        """
+        profile=True の場合のみ cProfile を開始する。
+        走査と YAML 生成で同じ ScanStats を使うと、結果は1つに合算される。
+        """
+        if not self._profile_enabled:
+            return
+        if self._profiler is None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def stop_profile(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+
+    # -----------------------------
+    # 結果の取得
+    # -----------------------------
+    @property
+    def slowest_files(self):
+        return [(path, seconds) for seconds, path in sorted(self._slow_files, reverse=True)]
+
+    @property
+    def slowest_dirs(self):
+        return [(path, seconds) for seconds, path in sorted(self._slow_dirs, reverse=True)]
+
+    def profile_text(self, limit=30, sort_by="cumulative"):
+        """
+        cProfile の結果を pstats 形式の文字列で返す。profile=False の場合は空文字。
+        """
+        if self._profiler is None:
+            return ""
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats(sort_by).print_stats(limit)
+        return out.getvalue()
+
+    def to_dict(self):
+        return {
+            "files": self.files,
+            "dirs": self.dirs,
+            "bytes_read": self.bytes_read,
+            "hardlinks_reused": self.hardlinks_reused,
+            "cache_hits": self.cache_hits,
+            "phases": {
+                name: {"count": v["count"], "seconds": round(v["seconds"], 6)}
+                for name, v in self.phases.items()
+            },
+            "slowest_files": [
+                {"path": p, "seconds": round(s, 6)} for p, s in self.slowest_files
+            ],
+            "slowest_dirs": [
+                {"path": p, "seconds": round(s, 6)} for p, s in self.slowest_dirs
+            ],
+        }
+
+    def summary(self):
+        """
+        進捗ログ向けの1行サマリ。
+        """
+        phase_text = " / ".join(
+            f"{name} {v['seconds']:.2f}s"
+            for name, v in self.phases.items() if v["count"]
+        )
+        extra_text = f", ハードリンク再利用 {self.hardlinks_reused}件" if self.hardlinks_reused else ""
+        if self.cache_hits:
+            extra_text += f", キャッシュ {self.cache_hits}件"
+        return (
+            f"計測: ファイル {self.files}件, ディレクトリ {self.dirs}件, "
+            f"読み込み {self.bytes_read / (1024 * 1024):.1f}MB{extra_text} | {phase_text}"
+        )
+
+
+def _push_top(heap, n, seconds, path):
+    if n <= 0:
+        return
+    if len(heap) < n:
+        heapq.heappush(heap, (seconds, path))
+    elif seconds > heap[0][0]:
+        heapq.heapreplace(heap, (seconds, path))
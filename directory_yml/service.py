@@ -0,0 +1,565 @@
+"""
+ローカルのスナップショットサービス。
+同じホスト上の複数のツールから、プロファイル(または任意のディレクトリ)のスナップショットを HTTP で取得する。
+
+- 同じ条件の要求が同時に来た場合、走査は1回だけ行い、その結果を全員に返す
+- 結果はキャッシュし、TTL を過ぎるか、走査したディレクトリの mtime が変わったら作り直す
+- 応答は YAML (generate_yaml() と同じ内容) または JSON Lines (1行1ノード) を逐次書き出す
+
+待ち受けは Unix ソケット (所有者のみ読み書き可)、または 127.0.0.1 の TCP ポート。
+root で指定できるのは、いずれかのプロファイルに登録されたディレクトリとその配下だけ (allow_any_root で解除)。
+
+  GET /snapshot?profile=NAME&format=yaml|jsonl
+  GET /snapshot?root=/path/a&root=/path/b&ignore=*.tmp&format=jsonl
+  GET /health
+"""
+
+import codecs
+import json
+import os
+import socketserver
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .config_manager import ConfigManager, default_project_name, profile_settings
+from .content_store import resolve_content
+from .file_processing import DEFAULT_IGNORE_PATTERNS, Scanner
+from .yml_generator import iter_yaml_chunks
+
+FORMATS = {
+    "yaml": "application/x-yaml; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+# 走査開始直前に更新されたディレクトリは、mtime の粒度によっては走査中の変更と区別できないため
+# その結果はキャッシュしない
+_MTIME_SLACK_NS = 50_000_000
+
+# 応答をまとめて書き出す単位[byte]
+_WRITE_BUFFER_BYTES = 64 * 1024
+
+# serve で待ち受ける Unix ソケットの既定のパス
+DEFAULT_UNIX_PATH = "dir2yaml.sock"
+
+
+class SnapshotService:
+    """
+    config_path: プロファイルを読み込む設定ファイル
+    ttl:         キャッシュの有効期間[秒]。0 ならキャッシュしない (同時要求のまとめだけ行う)
+    check_mtime: キャッシュを返す前に、走査したディレクトリの mtime が変わっていないか確認する。
+                 ファイルの上書き保存はディレクトリの mtime を変えないので、その変更は TTL で反映される
+    max_entries: キャッシュする結果の数の上限。結果はそれぞれ走査したツリー全体 (ファイル内容を含む) を
+                 メモリに持つので、メモリ使用量はおおよそ「1回の走査分 × max_entries」になる
+    workers / cache_bytes: Scanner にそのまま渡す
+    allow_any_root: root で任意のディレクトリを走査できるようにする。
+                    False ならプロファイルに登録されたディレクトリとその配下だけ (それ以外は PermissionError)
+    """
+
+    def __init__(
+        self,
+        config_path="config.json",
+        ttl=30.0,
+        check_mtime=True,
+        max_entries=16,
+        workers=1,
+        cache_bytes=0,
+        progress_callback=None,
+        allow_any_root=False
+    ):
+        self.config_path = config_path
+        self.ttl = ttl
+        self.check_mtime = check_mtime
+        self.max_entries = max_entries
+        self.workers = workers
+        self.cache_bytes = cache_bytes
+        self.progress_callback = progress_callback
+        self.allow_any_root = allow_any_root
+        self.counts = {"hit": 0, "miss": 0, "coalesced": 0}
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._scanners = {}
+        self._lock = threading.Lock()
+        self._config = None
+        self._config_mtime = None
+        self._allowed_roots = None
+        self._config_lock = threading.Lock()
+
+    # -----------------------------
+    # 要求の解釈
+    # -----------------------------
+    def resolve_settings(self, query):
+        """
+        クエリ (parse_qs の結果) から走査の設定を作る。
+        root が指定されていればそのディレクトリを、無ければ profile (省略時はアクティブプロファイル) を使う。
+        """
+        roots = query.get("root")
+        if roots:
+            directories = [os.path.abspath(d) for d in roots]
+            if not self.allow_any_root:
+                self._check_roots(directories)
+            ignore = [p.strip() for value in query.get("ignore", []) for p in value.split(",") if p.strip()]
+            settings = {
+                "directories": directories,
+                "ignore_patterns": DEFAULT_IGNORE_PATTERNS + ignore,
+                "max_file_size_bytes": int(_last(query, "max_file_size", 500000)),
+                "hardlink_refs": _flag(query, "hardlink_refs"),
+                "encodings": query.get("encoding") or None,
+                "normalize_newlines": _flag(query, "normalize_newlines"),
+                "project_name": default_project_name(directories),
+            }
+        else:
+            settings = profile_settings(self.config_manager(), _last(query, "profile"))
+        if _last(query, "project_name"):
+            settings["project_name"] = _last(query, "project_name")
+        for encoding in settings.get("encodings") or ():
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                raise ValueError(f"未対応の文字コードです: {encoding}")
+        return settings
+
+    def config_manager(self):
+        """
+        設定ファイルを読み込んだ ConfigManager。要求ごとには読み直さず、ファイルの mtime が変わった場合だけ読み直す。
+        """
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._config_lock:
+            if self._config is None or mtime != self._config_mtime:
+                self._config = ConfigManager(self.config_path)
+                self._allowed_roots = None
+                try:
+                    # 無ければ ConfigManager が作るので、その後の mtime を覚える
+                    self._config_mtime = os.stat(self.config_path).st_mtime_ns
+                except OSError:
+                    self._config_mtime = None
+            return self._config
+
+    def _check_roots(self, directories):
+        config_manager = self.config_manager()
+        with self._config_lock:
+            if self._allowed_roots is None:
+                self._allowed_roots = {
+                    os.path.realpath(d)
+                    for name in config_manager.get_profile_names()
+                    for d in config_manager.load_profile_data(name).get("directories", [])
+                }
+            allowed = self._allowed_roots
+        for d in directories:
+            # シンボリックリンクや .. で登録外のディレクトリを指していないか、実際のパスで確認する
+            path = os.path.realpath(d)
+            if not any(path == a or path.startswith(a.rstrip(os.sep) + os.sep) for a in allowed):
+                raise PermissionError(f"プロファイルに登録されていないディレクトリです: {d}")
+
+    # -----------------------------
+    # 走査とキャッシュ
+    # -----------------------------
+    def get_snapshot(self, settings, refresh=False):
+        """
+        戻り値: (_Snapshot, "hit" | "miss" | "coalesced")
+        同じ設定の走査が実行中なら、新たに走査せずその完了を待つ。
+        """
+        key = _request_key(settings)
+        if not refresh:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry):
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.counts["hit"] += 1
+                return entry, "hit"
+
+        with self._lock:
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = _Pending()
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            with self._lock:
+                self.counts["coalesced"] += 1
+            return pending.entry, "coalesced"
+
+        try:
+            pending.entry = self._scan(settings)
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if pending.entry is not None:
+                    self.counts["miss"] += 1
+                    old = self._entries.pop(key, None)
+                    if old is not None:
+                        old.discard()
+                    if self._keeps(pending.entry):
+                        self._entries[key] = pending.entry
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)[1].discard()
+            pending.done.set()
+        return pending.entry, "miss"
+
+    def _scan(self, settings):
+        scanner = self._scanner_for(settings)
+        started_ns = time.time_ns()
+        start = time.perf_counter()
+        dir_mtimes = []
+        # 存在するルートだけを渡し、ツリーと実際のパスを対応付ける
+        roots = [d for d in settings["directories"] if os.path.isdir(d)]
+        structure_data = scanner.scan(roots)
+        if len(structure_data) == len(roots):
+            for root_dir, root in zip(roots, structure_data):
+                _collect_dir_mtimes(root_dir, root["children"], scanner.excluded_dirs, dir_mtimes)
+        else:
+            # 走査中にルートが消えた → 対応付けられないのでキャッシュしない
+            dir_mtimes = [(root_dir, None) for root_dir in roots]
+        elapsed = time.perf_counter() - start
+        cacheable = all(m is not None and m < started_ns - _MTIME_SLACK_NS for _path, m in dir_mtimes)
+        self._log(
+            f"走査しました: {', '.join(settings['directories'])} "
+            f"({elapsed:.2f}s, ディレクトリ {len(dir_mtimes)}件{'' if cacheable else ', 走査中に変更あり'})"
+        )
+        return _Snapshot(structure_data, settings["project_name"], dir_mtimes, cacheable)
+
+    def _scanner_for(self, settings):
+        # 設定ごとに Scanner を使い回し、コンパイル済みのパターンとファイルのキャッシュを共有する
+        key = (
+            tuple(settings["ignore_patterns"]),
+            settings["max_file_size_bytes"],
+            settings.get("hardlink_refs", False),
+            tuple(settings.get("encodings") or ()),
+            settings.get("normalize_newlines", False),
+        )
+        with self._lock:
+            scanner = self._scanners.get(key)
+            if scanner is None:
+                scanner = self._scanners[key] = Scanner(
+                    settings["ignore_patterns"],
+                    settings["max_file_size_bytes"],
+                    workers=self.workers,
+                    hardlink_refs=settings.get("hardlink_refs", False),
+                    cache_bytes=self.cache_bytes,
+                    encodings=settings.get("encodings"),
+                    normalize_newlines=settings.get("normalize_newlines", False)
+                )
+            return scanner
+
+    def _keeps(self, entry):
+        return self.ttl > 0 and entry.cacheable
+
+    def _is_fresh(self, entry):
+        if time.monotonic() - entry.created > self.ttl:
+            return False
+        if not self.check_mtime:
+            return True
+        for path, mtime in entry.dir_mtimes:
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.discard()
+
+    def close(self):
+        with self._lock:
+            scanners = list(self._scanners.values())
+            self._scanners.clear()
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.discard()
+        for scanner in scanners:
+            scanner.close()
+
+    # -----------------------------
+    # 出力
+    # -----------------------------
+    def iter_output(self, entry, fmt):
+        """
+        スナップショットを fmt ("yaml" / "jsonl") の UTF-8 バイト列で順に返す。
+        キャッシュする entry では、出力を生成しながら一時ファイルにも書き、次回からはそのファイルを返す
+        (出力全体をメモリには持たない)。
+        同じ形式の出力が同時に要求された場合、生成は1つだけ行い、他はその完了を待つ。
+        """
+        path = entry.rendered.get(fmt)
+        if path is None:
+            with entry.render_lock(fmt):
+                path = entry.rendered.get(fmt)
+                if path is None:
+                    yield from self._render(entry, fmt)
+                    return
+        try:
+            f = open(path, "rb")
+        except OSError:
+            # 読み始める前にキャッシュから外れて削除された
+            yield from self._render(entry, fmt)
+            return
+        with f:
+            while True:
+                data = f.read(_WRITE_BUFFER_BYTES)
+                if not data:
+                    break
+                yield data
+
+    def _render(self, entry, fmt):
+        if fmt == "yaml":
+            chunks = iter_yaml_chunks(entry.structure_data, entry.project_name)
+        else:
+            chunks = iter_jsonl_chunks(entry.structure_data)
+        if not self._keeps(entry) or entry.discarded:
+            for chunk in chunks:
+                yield chunk.encode("utf-8")
+            return
+
+        fd, path = tempfile.mkstemp(prefix="dir2yaml_", suffix=f".{fmt}")
+        done = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    data = chunk.encode("utf-8")
+                    f.write(data)
+                    yield data
+            done = entry.keep_rendered(fmt, path)
+        finally:
+            # 途中で切断された/キャッシュから外れた場合は残さない
+            if not done:
+                _remove_quietly(path)
+
+    def _log(self, message):
+        if self.progress_callback:
+            self.progress_callback(message)
+
+
+class _Snapshot:
+    __slots__ = (
+        "structure_data", "project_name", "dir_mtimes", "cacheable", "created", "rendered", "discarded",
+        "_render_locks", "_lock"
+    )
+
+    def __init__(self, structure_data, project_name, dir_mtimes, cacheable):
+        self.structure_data = structure_data
+        self.project_name = project_name
+        self.dir_mtimes = dir_mtimes
+        self.cacheable = cacheable
+        self.created = time.monotonic()
+        self.rendered = {}  # fmt -> 出力を書いた一時ファイル
+        self.discarded = False
+        self._render_locks = {}
+        self._lock = threading.Lock()
+
+    def render_lock(self, fmt):
+        with self._lock:
+            return self._render_locks.setdefault(fmt, threading.Lock())
+
+    def keep_rendered(self, fmt, path):
+        """
+        出力を書き終えた一時ファイルを登録する。既にキャッシュから外れていれば False (呼び出し側で削除する)。
+        """
+        with self._lock:
+            if self.discarded:
+                return False
+            self.rendered[fmt] = path
+            return True
+
+    def discard(self):
+        """
+        キャッシュから外れたときに呼ぶ。一時ファイルを削除する (読み出し中の応答は開いたハンドルで最後まで読める)。
+        """
+        with self._lock:
+            self.discarded = True
+            paths = list(self.rendered.values())
+            self.rendered.clear()
+        for path in paths:
+            _remove_quietly(path)
+
+
+class _Pending:
+    __slots__ = ("done", "entry", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+def iter_jsonl_chunks(structure_data):
+    """
+    ツリーを1行1ノードの JSON Lines で YAML と同じ順(深さ優先)に返す。
+    各行には "root" (ルート名) が付き、ディレクトリの行は children を持たない。
+    """
+    for root in structure_data:
+        stack = [root["children"]]
+        while stack:
+            node = stack.pop()
+            if node["type"] == "directory":
+                line = {k: v for k, v in node.items() if k != "children"}
+                stack.extend(reversed(node.get("children", [])))
+            else:
+                line = resolve_content(node)
+            yield json.dumps({"root": root["root"], **line}, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _collect_dir_mtimes(root_dir, node, excluded_dirs, out):
+    """
+    ツリー内のディレクトリの (実際のパス, mtime_ns) を out に追加する。
+    中身を走査しない除外フォルダは対象外 (存在の有無は親ディレクトリの mtime でわかる)。
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node["rel_path"] and node["name"] in excluded_dirs:
+            continue
+        path = os.path.join(root_dir, node["rel_path"]) if node["rel_path"] else root_dir
+        try:
+            out.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            out.append((path, None))
+        stack.extend(child for child in node["children"] if child["type"] == "directory")
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _request_key(settings):
+    return (
+        tuple(settings["directories"]),
+        tuple(settings["ignore_patterns"]),
+        settings["max_file_size_bytes"],
+        settings.get("hardlink_refs", False),
+        tuple(settings.get("encodings") or ()),
+        settings.get("normalize_newlines", False),
+        settings["project_name"],
+    )
+
+
+def _last(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _flag(query, name):
+    return _last(query, name, "0").lower() in ("1", "true", "yes")
+
+
+# -----------------------------
+# HTTP
+# -----------------------------
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "dir2yaml"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self._send_text(200, "ok\n")
+            return
+        if url.path != "/snapshot":
+            self._send_text(404, "not found\n")
+            return
+
+        service = self.server.service
+        query = parse_qs(url.query)
+        fmt = _last(query, "format", "yaml")
+        if fmt not in FORMATS:
+            self._send_text(400, f"format は {' / '.join(FORMATS)} のいずれかです\n")
+            return
+        try:
+            settings = service.resolve_settings(query)
+        except PermissionError as e:
+            self._send_text(403, f"{e}\n")
+            return
+        except ValueError as e:
+            self._send_text(400, f"{e}\n")
+            return
+
+        start = time.perf_counter()
+        try:
+            entry, status = service.get_snapshot(settings, refresh=_flag(query, "refresh"))
+        except Exception as e:
+            self._send_text(500, f"走査に失敗しました: {e}\n")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", FORMATS[fmt])
+        self.send_header("X-Dir2YAML-Cache", status)
+        self.end_headers()
+        buffer = []
+        buffered = 0
+        try:
+            for chunk in service.iter_output(entry, fmt):
+                buffer.append(chunk)
+                buffered += len(chunk)
+                if buffered >= _WRITE_BUFFER_BYTES:
+                    self.wfile.write(b"".join(buffer))
+                    buffer, buffered = [], 0
+            if buffer:
+                self.wfile.write(b"".join(buffer))
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        service._log(f"{self.path} -> {status} ({time.perf_counter() - start:.2f}s)")
+
+    def _send_text(self, code, text):
+        data = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix ソケットでは client_address が空
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass  # 要求ごとのログは do_GET で service に出す
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host="127.0.0.1", port=8765, unix_path=None):
+    """
+    service を公開するサーバーを作る。serve_forever() で待ち受け、shutdown() で止める。
+    unix_path を指定すると TCP ではなく Unix ソケットで待ち受ける (前回の残ったソケットは削除する)。
+    ソケットは所有者だけが接続できるよう 0600 で作る。
+    """
+    if unix_path:
+        try:
+            if stat.S_ISSOCK(os.stat(unix_path).st_mode):
+                os.remove(unix_path)
+        except FileNotFoundError:
+            pass
+        # bind() が作るソケットファイルの権限は umask で決まる。作った後の chmod では一瞬他人に開くので、先に絞る
+        old_umask = os.umask(0o177)
+        try:
+            server = _UnixHTTPServer(unix_path, _Handler)
+        finally:
+            os.umask(old_umask)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.service = service
+    return server
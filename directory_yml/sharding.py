@@ -0,0 +1,249 @@
+"""
+1つの巨大なルートを複数プロセスで分担して走査する。
+
+ルート直下(必要ならさらに下の階層)のディレクトリを「シャード」に分け、プロセスプールで並列に走査する。
+各シャードはそのディレクトリ以下の部分ツリーを返し、親プロセスが元の位置(名前順)に差し戻すので、
+出力は Scanner.scan() で1プロセスで走査した場合と同じになる。
+
+balance:
+  "entries" ルート直下のディレクトリをそのまま名前順にシャードにする
+  "size"    先にファイル数だけを数え (stat しない)、大きいディレクトリは下の階層まで分割して、
+            大きいシャードから順にプロセスへ割り当てる
+"""
+
+import os
+import time
+
+from .file_processing import SKIPPED_BINARY, SKIPPED_BY_NAME, SKIPPED_BY_SIZE, Scanner, _dir_node
+from .yml_generator import unique_root_names
+
+BALANCE_MODES = ("entries", "size")
+
+# balance="size" で分割を検討する深さ (ルート直下 = 1)
+MAX_SPLIT_DEPTH = 3
+
+_MARKERS = frozenset((SKIPPED_BINARY, SKIPPED_BY_NAME, SKIPPED_BY_SIZE))
+
+
+def scan_sharded(
+    scanner,
+    directories,
+    processes=None,
+    balance="size",
+    progress_callback=None,
+    stats=None,
+    content_store=None,
+    file_filter=None
+):
+    """
+    scanner.scan() と同じ結果を、ディレクトリ単位のシャードに分けてプロセスプールで走査して返す。
+    processes: プロセス数 (既定: CPU数)
+    content_store: 各シャードの結果が届いた時点で、ファイル内容をここへ移す
+                   (全シャードの内容を同時にメモリへ持たない)
+    ハードリンクの再利用はシャードの中だけで行う。hardlink_refs=True の Scanner は
+    シャードをまたぐ参照が作れないため使えない。
+    """
+    if scanner.hardlink_refs:
+        raise ValueError("hardlink_refs=True の Scanner はシャード走査に使えません")
+    if balance not in BALANCE_MODES:
+        raise ValueError(f"balance は {' / '.join(BALANCE_MODES)} のいずれかです: {balance}")
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    processes = processes or os.cpu_count() or 1
+    results = []
+    roots = [d for d in directories if os.path.isdir(d)]
+    with ProcessPoolExecutor(processes) as pool:
+        for root_dir, root_name in zip(roots, unique_root_names(roots)):
+            if progress_callback:
+                progress_callback(f"ディレクトリ走査開始 (シャード {processes}プロセス): {root_dir}")
+            sharder = _Sharder(
+                scanner, pool, processes, balance, progress_callback, stats, content_store, file_filter, root_name
+            )
+            results.append({
+                "root": root_name,
+                "children": sharder.scan(root_dir)
+            })
+    return results
+
+
+class _Sharder:
+    """
+    1つのルートの分割・投入・差し戻しを行う。
+    """
+
+    def __init__(
+        self, scanner, pool, processes, balance, progress_callback, stats, content_store, file_filter, root_name
+    ):
+        self.scanner = scanner
+        self.pool = pool
+        self.processes = processes
+        self.balance = balance
+        self.stats = stats
+        self.content_store = content_store
+        self.file_filter = file_filter
+        self.ctx = scanner._context(progress_callback, stats, content_store, file_filter, per_scan=True)
+        self.ctx.root_name = root_name
+        self.options = dict(scanner.options(), cache_bytes=0)
+        self.weights = {}
+        self.split_threshold = None
+        self.shards = []
+
+    def scan(self, root_dir):
+        if self.balance == "size":
+            total = _count_files(self.scanner, root_dir, 0, self.weights)
+            # 最も大きいシャードが全体の 1/(2×プロセス数) 程度に収まるまで分割する
+            self.split_threshold = max(total // (self.processes * 2), 1)
+
+        root = self._plan(root_dir, root_dir, depth=0)
+
+        # 大きいシャードから投入する (最後に大きいものが残って待たされないように)
+        order = sorted(
+            range(len(self.shards)),
+            key=lambda i: -self.weights.get(self.shards[i][1], 0)
+        )
+        futures = {}
+        for i in order:
+            slot, path = self.shards[i]
+            future = self.pool.submit(
+                _scan_shard, self.options, root_dir, self.ctx.root_name, path, self.stats is not None,
+                self.file_filter
+            )
+            futures[future] = slot
+
+        # シャードを待つ間に、分割した階層の直下のファイルをこのプロセスで処理する
+        self._resolve_files(root_dir, root)
+        self._collect(futures)
+        return _finalize(root)
+
+    def _plan(self, root_dir, dir_path, depth):
+        """
+        dir_path のノードを作り、サブディレクトリはシャードにするか、さらに分割する。
+        ファイルは ("file", パス) のまま残しておく。
+        """
+        if self.stats is not None:
+            start = time.perf_counter()
+        node = _dir_node(root_dir, dir_path)
+        children = node["children"] = []
+        entries = self.scanner._list_entries(self.ctx, root_dir, dir_path)
+        if self.stats is not None:
+            self.stats.add_dir(dir_path, time.perf_counter() - start)
+        for kind, value in entries:
+            if kind == "dir":
+                if self._should_split(value, depth + 1):
+                    children.append(self._plan(root_dir, value, depth + 1))
+                else:
+                    slot = [value]
+                    children.append(slot)
+                    self.shards.append((slot, value))
+            elif kind == "file":
+                children.append((kind, value))
+            else:
+                children.append(value)
+        return node
+
+    def _should_split(self, dir_path, depth):
+        if self.balance != "size" or depth >= MAX_SPLIT_DEPTH:
+            return False
+        return self.weights.get(dir_path, 0) > self.split_threshold
+
+    def _resolve_files(self, root_dir, node):
+        children = node["children"]
+        for i, child in enumerate(children):
+            if isinstance(child, tuple):
+                children[i] = self.scanner._file_node(self.ctx, root_dir, child[1])
+            elif isinstance(child, dict) and child["type"] == "directory":
+                self._resolve_files(root_dir, child)
+
+    def _collect(self, futures):
+        from concurrent.futures import as_completed
+
+        for future in as_completed(futures):
+            slot = futures[future]
+            node, shard_stats, shard_filter, seconds = future.result()
+            if self.content_store is not None:
+                _move_contents(node, self.content_store)
+            if self.stats is not None:
+                self.stats.merge(shard_stats)
+            if self.file_filter is not None:
+                self.file_filter.merge(shard_filter)
+            if self.ctx.progress_callback:
+                self.ctx.progress_callback(f"シャード完了: {slot[0]} ({seconds:.2f}s)")
+            slot[0] = node
+
+
+def _scan_shard(options, root_dir, root_name, dir_path, with_stats, file_filter):
+    """
+    プロセスプールで実行する。dir_path 以下を走査し、部分ツリーと計測結果を返す。
+    """
+    from .scan_stats import ScanStats
+
+    start = time.perf_counter()
+    scanner = Scanner(**options)
+    stats = ScanStats() if with_stats else None
+    if file_filter is not None:
+        # 親から受け取った時点の件数は親側で数えてあるので、このシャードの分だけ数える
+        file_filter.excluded = file_filter.pruned = 0
+    ctx = scanner._context(None, stats, None, file_filter, per_scan=True)
+    ctx.root_name = root_name
+    try:
+        node = scanner._walk(ctx, root_dir, dir_path)
+    finally:
+        scanner.close()
+    return node, stats, file_filter, time.perf_counter() - start
+
+
+def _finalize(node):
+    """
+    シャードの枠 ([部分ツリー]) を中身に置き換え、除外されたファイル (None) を取り除く。
+    """
+    children = []
+    for child in node["children"]:
+        if isinstance(child, list):
+            child = child[0]
+        elif child is not None and child["type"] == "directory":
+            child = _finalize(child)
+        if child is not None:
+            children.append(child)
+    node["children"] = children
+    return node
+
+
+def _move_contents(node, content_store):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for child in node["children"]:
+            if child["type"] == "directory":
+                stack.append(child)
+            elif isinstance(child.get("content"), str) and child["content"] not in _MARKERS:
+                child["content"] = content_store.put(child["content"])
+
+
+def _count_files(scanner, dir_path, depth, weights):
+    """
+    dir_path 以下のファイル数を数える (除外ルールは Scanner と同じ。stat はしない)。
+    深さ MAX_SPLIT_DEPTH までのディレクトリの件数を weights に記録する。
+    """
+    total = 0
+    try:
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            continue
+        if is_dir and entry.name in scanner.excluded_dirs:
+            continue
+        if scanner.is_ignored(entry.name):
+            continue
+        if is_dir:
+            total += _count_files(scanner, entry.path, depth + 1, weights)
+        else:
+            total += 1
+    if depth <= MAX_SPLIT_DEPTH:
+        weights[dir_path] = total
+    return total
@@ -0,0 +1,295 @@
+"""
+2つのスナップショット(YAML出力)の差分。
+
+両スナップショットのファイルを "ルート名/rel_path" のキー順に並べ、マージ結合で比較する。
+- インデックス(.idx)があり、YAML と対応していればそれをそのまま順に読む (既にキー順)
+- 無ければ YAML をイベント単位で読み、キー順に外部ソートする
+どちらの場合もスナップショット全体をメモリに載せない。
+
+変更は次の4種類:
+  added     新しく追加されたファイル
+  removed   削除されたファイル
+  modified  同じパスで sha256 が変わったファイル
+  moved     削除されたファイルと同じ sha256 のファイルが別のパスに現れたもの
+"""
+
+import heapq
+import json
+import tempfile
+
+from .snapshot_index import _escape_key, _unescape_key, index_matches, index_path_for, read_index_header
+from .yml_generator import make_index_key
+
+# 外部ソートで一度にメモリに保持する行数
+SORT_CHUNK_LINES = 200_000
+
+_NO_DIGEST = b"-"
+
+
+def diff_snapshots(old_path, new_path, detect_moves=True):
+    """
+    old_path → new_path の変更を dict で順に返すジェネレータ。
+    modified はパスの順に、moved / added / removed はその後に sha256 の順で返す。
+    """
+    removed = _LineSpool()
+    added = _LineSpool()
+    try:
+        for key, old_digest, new_digest in _merge_join(
+            iter_snapshot_entries(old_path), iter_snapshot_entries(new_path)
+        ):
+            if old_digest is None:
+                added.append(new_digest + b"\t" + key)
+            elif new_digest is None:
+                removed.append(old_digest + b"\t" + key)
+            elif old_digest != new_digest:
+                yield {
+                    "op": "modified",
+                    "path": _decode_key(key),
+                    "old_sha256": _decode_digest(old_digest),
+                    "new_sha256": _decode_digest(new_digest),
+                }
+
+        if detect_moves:
+            yield from _match_moves(removed.sorted_lines(), added.sorted_lines())
+        else:
+            for line in removed.sorted_lines():
+                digest, key = line.split(b"\t", 1)
+                yield _change("removed", key, digest)
+            for line in added.sorted_lines():
+                digest, key = line.split(b"\t", 1)
+                yield _change("added", key, digest)
+    finally:
+        removed.close()
+        added.close()
+
+
+def write_diff(old_path, new_path, out, detect_moves=True):
+    """
+    差分を JSON Lines (1行1変更) で out (テキストストリーム) に書き出し、件数の集計を返す。
+    """
+    counts = {"added": 0, "removed": 0, "modified": 0, "moved": 0}
+    for change in diff_snapshots(old_path, new_path, detect_moves=detect_moves):
+        counts[change["op"]] += 1
+        out.write(json.dumps(change, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return counts
+
+
+def iter_snapshot_entries(yaml_path):
+    """
+    スナップショットのファイルを (エスケープ済みキー, sha256) のバイト列でキー順に返す。
+    """
+    index_path = index_path_for(yaml_path)
+    if index_matches(yaml_path, index_path):
+        return _iter_index_entries(index_path)
+    # インデックスが無い/YAML と対応しない (YAML だけ書き換えられた等) → YAML から作る
+    lines = (
+        _escape_key(key).encode("utf-8") + b"\t" + (digest.encode("ascii") if digest else _NO_DIGEST)
+        for key, digest in _iter_yaml_file_nodes(yaml_path)
+    )
+    return (_split_entry(line) for line in _external_sort(lines))
+
+
+# -----------------------------
+# マージ結合
+# -----------------------------
+def _merge_join(old_entries, new_entries):
+    """
+    キー順の2つの列を突き合わせ、(key, old_digest, new_digest) を返す。
+    片方にしか無いキーは、無い側が None。
+    """
+    old_item = next(old_entries, None)
+    new_item = next(new_entries, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield old_item[0], old_item[1], None
+            old_item = next(old_entries, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield new_item[0], None, new_item[1]
+            new_item = next(new_entries, None)
+        else:
+            yield old_item[0], old_item[1], new_item[1]
+            old_item = next(old_entries, None)
+            new_item = next(new_entries, None)
+
+
+def _match_moves(removed_lines, added_lines):
+    """
+    sha256 順に並んだ削除/追加を突き合わせ、同じ sha256 のものを moved として対にする。
+    """
+    removed_groups = _group_by_digest(removed_lines)
+    added_groups = _group_by_digest(added_lines)
+    removed_group = next(removed_groups, None)
+    added_group = next(added_groups, None)
+
+    while removed_group is not None or added_group is not None:
+        if added_group is None or (removed_group is not None and removed_group[0] < added_group[0]):
+            digest, keys = removed_group
+            for key in keys:
+                yield _change("removed", key, digest)
+            removed_group = next(removed_groups, None)
+        elif removed_group is None or added_group[0] < removed_group[0]:
+            digest, keys = added_group
+            for key in keys:
+                yield _change("added", key, digest)
+            added_group = next(added_groups, None)
+        else:
+            digest, old_keys = removed_group
+            _, new_keys = added_group
+            if digest == _NO_DIGEST:
+                # sha256 が取れなかったファイル同士は移動とみなさない
+                pairs = 0
+            else:
+                pairs = min(len(old_keys), len(new_keys))
+            for old_key, new_key in zip(old_keys[:pairs], new_keys[:pairs]):
+                yield {
+                    "op": "moved",
+                    "path": _decode_key(new_key),
+                    "from": _decode_key(old_key),
+                    "sha256": _decode_digest(digest),
+                }
+            for key in old_keys[pairs:]:
+                yield _change("removed", key, digest)
+            for key in new_keys[pairs:]:
+                yield _change("added", key, digest)
+            removed_group = next(removed_groups, None)
+            added_group = next(added_groups, None)
+
+
+def _group_by_digest(lines):
+    current = None
+    keys = []
+    for line in lines:
+        digest, key = line.split(b"\t", 1)
+        if digest != current:
+            if current is not None:
+                yield current, keys
+            current, keys = digest, []
+        keys.append(key)
+    if current is not None:
+        yield current, keys
+
+
+def _change(op, key, digest):
+    return {"op": op, "path": _decode_key(key), "sha256": _decode_digest(digest)}
+
+
+def _decode_key(key):
+    return _unescape_key(key.decode("utf-8"))
+
+
+def _decode_digest(digest):
+    return None if digest == _NO_DIGEST else digest.decode("ascii")
+
+
+# -----------------------------
+# 入力の読み込み
+# -----------------------------
+def _iter_index_entries(index_path):
+    with open(index_path, "rb") as f:
+        read_index_header(f.readline(), index_path)
+        for line in f:
+            key, _offset, _length, digest = line.rstrip(b"\n").split(b"\t")
+            yield key, digest
+
+
+def _split_entry(line):
+    key, digest = line.rstrip(b"\n").split(b"\t")
+    return key, digest
+
+
+def _iter_yaml_file_nodes(yaml_path):
+    """
+    YAML をイベント単位で読み、ファイルノードごとに (キー, sha256) を返す。
+    ツリー全体を構築しないので、メモリ使用量はネストの深さ程度に収まる。
+    """
+    import yaml
+    from yaml.events import (
+        MappingEndEvent, MappingStartEvent, ScalarEvent, SequenceEndEvent, SequenceStartEvent
+    )
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    # スタックの各要素: マッピングなら [値のdict, 値待ちのキー]、シーケンスなら None
+    stack = []
+    current_root = ""
+    with open(yaml_path, "r", encoding="utf-8") as f:
+        for event in yaml.parse(f, Loader=loader):
+            if isinstance(event, ScalarEvent):
+                if not stack or stack[-1] is None:
+                    continue
+                frame = stack[-1]
+                if frame[1] is None:
+                    frame[1] = event.value
+                    continue
+                value = event.value
+                if event.style is None and value in ("null", "~", ""):
+                    value = None
+                if frame[1] in ("type", "rel_path", "sha256", "root"):
+                    frame[0][frame[1]] = value
+                if frame[1] == "root":
+                    current_root = value or ""
+                frame[1] = None
+            elif isinstance(event, MappingStartEvent):
+                stack.append([{}, None])
+            elif isinstance(event, SequenceStartEvent):
+                stack.append(None)
+            elif isinstance(event, (MappingEndEvent, SequenceEndEvent)):
+                frame = stack.pop()
+                if frame is not None and frame[0].get("type") == "file":
+                    values = frame[0]
+                    yield make_index_key(current_root, values.get("rel_path") or ""), values.get("sha256")
+                # 親マッピングの「値待ちのキー」はこの子ノードで消費された
+                if stack and stack[-1] is not None:
+                    stack[-1][1] = None
+
+
+def _external_sort(lines, chunk_lines=None):
+    """
+    バイト列の行を外部ソートして順に返す。chunk_lines 行ごとに一時ファイルへ書き出し、
+    最後に heapq.merge でまとめる。
+    """
+    chunk_lines = chunk_lines or SORT_CHUNK_LINES
+    spool = _LineSpool(chunk_lines)
+    try:
+        for line in lines:
+            spool.append(line)
+        yield from spool.sorted_lines()
+    finally:
+        spool.close()
+
+
+class _LineSpool:
+    """
+    行を溜めてソート済みで返す入れ物。一定行数を超えた分はソート済みの一時ファイルに逃がす。
+    """
+
+    def __init__(self, chunk_lines=None):
+        self.chunk_lines = chunk_lines or SORT_CHUNK_LINES
+        self._buffer = []
+        self._runs = []
+
+    def append(self, line):
+        self._buffer.append(line)
+        if len(self._buffer) >= self.chunk_lines:
+            self._spill()
+
+    def _spill(self):
+        self._buffer.sort()
+        run = tempfile.TemporaryFile()
+        for line in self._buffer:
+            run.write(line + b"\n")
+        run.seek(0)
+        self._runs.append(run)
+        self._buffer = []
+
+    def sorted_lines(self):
+        self._buffer.sort()
+        if not self._runs:
+            return iter(self._buffer)
+        runs = [(line.rstrip(b"\n") for line in run) for run in self._runs]
+        return heapq.merge(*runs, iter(self._buffer))
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._buffer = []
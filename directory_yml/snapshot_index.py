@@ -0,0 +1,259 @@
+"""
+スナップショット(YAML出力)のインデックス(サイドカー)と、ランダムアクセス用リーダ。
+
+インデックスはテキスト形式で、1行目がヘッダ
+  #dir2yaml-index v2\t<件数>\t<YAMLのサイズ>\t<YAMLの指紋>
+以降はキー順にソートされた
+  <key>\t<offset>\t<length>\t<sha256>
+の行が並ぶ。key は "ルート名/rel_path" ('/' 区切り)。
+offset / length は YAML ファイル内のファイルノード断片の UTF-8 バイト位置。
+指紋は YAML の先頭と末尾 (各 64KB) の sha256。YAML だけが書き換えられた/古いインデックスが残った場合に
+別のバイト位置を読まないよう、読み込み時にサイズと指紋を照合する。
+"""
+
+import mmap
+import os
+import textwrap
+
+INDEX_SUFFIX = ".idx"
+INDEX_HEADER = "#dir2yaml-index v2"
+
+# 指紋に使う YAML の先頭/末尾の長さ[byte]
+_FINGERPRINT_BYTES = 64 * 1024
+
+
+def index_path_for(yaml_path):
+    return yaml_path + INDEX_SUFFIX
+
+
+def write_index_file(index_path, index, yaml_path):
+    """
+    index: generate_yaml(..., index=[...]) で得たエントリのリスト
+    yaml_path: 書き出し済みの YAML。ヘッダにそのサイズと指紋を書く
+    """
+    size, fingerprint = yaml_fingerprint(yaml_path)
+    # キーのバイト順で二分探索するため、バイト列としてソートする
+    encoded = sorted(
+        "\t".join((_escape_key(key), str(offset), str(length), sha256 or "-")).encode("utf-8")
+        for key, offset, length, sha256 in index
+    )
+    with open(index_path, "wb") as f:
+        f.write(f"{INDEX_HEADER}\t{len(encoded)}\t{size}\t{fingerprint}\n".encode("utf-8"))
+        for line in encoded:
+            f.write(line + b"\n")
+
+
+def yaml_fingerprint(yaml_path):
+    """
+    戻り値: (YAMLのサイズ, 指紋)
+    """
+    with open(yaml_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        head = f.read(_FINGERPRINT_BYTES)
+        f.seek(max(len(head), size - _FINGERPRINT_BYTES))
+        tail = f.read()
+    return size, _fingerprint(head, tail)
+
+
+def read_index_header(header, index_path=""):
+    """
+    ヘッダ行 (bytes) を解釈し、(件数, YAMLのサイズ, 指紋) を返す。形式が違う (古い版を含む) 場合は ValueError。
+    """
+    fields = header.rstrip(b"\n").decode("utf-8", errors="replace").split("\t")
+    if fields[0] != INDEX_HEADER or len(fields) != 4:
+        raise ValueError(f"インデックスの形式が不正です (古い版の場合は YAML を出力し直してください): {index_path}")
+    return int(fields[1]), int(fields[2]), fields[3]
+
+
+def index_matches(yaml_path, index_path=None):
+    """
+    インデックスが存在し、yaml_path の YAML から作られたものなら True。
+    """
+    index_path = index_path or index_path_for(yaml_path)
+    try:
+        with open(index_path, "rb") as f:
+            _count, size, fingerprint = read_index_header(f.readline(), index_path)
+        return yaml_fingerprint(yaml_path) == (size, fingerprint)
+    except (OSError, ValueError):
+        return False
+
+
+def load_indexed_dirs(index_path):
+    """
+    インデックスに含まれるファイルの親ディレクトリのキー ("ルート名/rel_dir") の集合を返す。
+    ルート直下のファイルの親はルート名そのもの。
+    """
+    dirs = set()
+    with open(index_path, "rb") as f:
+        read_index_header(f.readline(), index_path)
+        for line in f:
+            key = _unescape_key(line.split(b"\t", 1)[0].decode("utf-8"))
+            dirs.add(key.rsplit("/", 1)[0])
+    return dirs
+
+
+class SnapshotReader:
+    """
+    スナップショットとインデックスを mmap し、YAML全体をパースせずに
+    単一ファイルのノードやサブツリーの一覧を取り出す。
+    インデックスが YAML と対応しない (サイズ/指紋が違う) 場合は ValueError。
+    """
+
+    def __init__(self, yaml_path, index_path=None):
+        self.yaml_path = yaml_path
+        self.index_path = index_path or index_path_for(yaml_path)
+
+        self._yaml_file = open(self.yaml_path, "rb")
+        self._index_file = open(self.index_path, "rb")
+        self._yaml_mm = _mmap_file(self._yaml_file)
+        self._index_mm = _mmap_file(self._index_file)
+
+        try:
+            if self._index_mm is None:
+                raise ValueError(f"インデックスの形式が不正です: {self.index_path}")
+            header_end = self._index_mm.find(b"\n")
+            _count, size, fingerprint = read_index_header(self._index_mm[:header_end], self.index_path)
+            # 開いた YAML そのもので照合する (照合後に差し替えられても、mmap した内容は変わらない)
+            yaml_mm = self._yaml_mm if self._yaml_mm is not None else b""
+            head = yaml_mm[:_FINGERPRINT_BYTES]
+            tail = yaml_mm[max(len(head), len(yaml_mm) - _FINGERPRINT_BYTES):]
+            if (len(yaml_mm), _fingerprint(head, tail)) != (size, fingerprint):
+                raise ValueError(f"インデックスが YAML と一致しません (YAML を出力し直してください): {self.index_path}")
+        except ValueError:
+            self.close()
+            raise
+        self._records_start = header_end + 1
+
+    def close(self):
+        for mm in (self._yaml_mm, self._index_mm):
+            if mm is not None:
+                mm.close()
+        self._yaml_mm = self._index_mm = None
+        self._yaml_file.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # -----------------------------
+    # 検索
+    # -----------------------------
+    def lookup(self, key):
+        """
+        key ("ルート名/rel_path") に対応するエントリを返す。無ければ None。
+        """
+        target = _escape_key(key).encode("utf-8")
+        pos = self._bisect_left(target + b"\t")
+        record = self._record_at(pos)
+        if record is None or record[0] != target:
+            return None
+        return _parse_record(record)
+
+    def get_file(self, key):
+        """
+        key に対応するファイルノード(dict)を返す。無ければ None。
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        return self.read_node(entry)
+
+    def read_node(self, entry):
+        start = entry["offset"]
+        raw = self._yaml_mm[start:start + entry["length"]]
+        text = textwrap.dedent(raw.decode("utf-8"))
+        import yaml
+        nodes = yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        return nodes[0] if nodes else None
+
+    def list_dir(self, dir_key):
+        """
+        dir_key ("ルート名" または "ルート名/サブディレクトリ") 配下の
+        全ファイルのエントリをキー順に返す。
+        """
+        prefix = _escape_key(dir_key.rstrip("/") + "/").encode("utf-8")
+        pos = self._bisect_left(prefix)
+        entries = []
+        while True:
+            record = self._record_at(pos)
+            if record is None or not record[0].startswith(prefix):
+                break
+            entries.append(_parse_record(record))
+            pos = record[-1]
+        return entries
+
+    def _bisect_left(self, target):
+        """
+        target 以上となる最初のレコードの開始位置を返す。
+        行頭を揃えながらバイト位置で二分探索する。
+        """
+        mm = self._index_mm
+        lo = self._records_start
+        hi = len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # mid を含む行の先頭へ戻る
+            line_start = mm.rfind(b"\n", lo, mid) + 1
+            if line_start <= 0 or line_start < lo:
+                line_start = lo
+            line_end = mm.find(b"\n", line_start)
+            if line_end < 0:
+                line_end = len(mm)
+            if mm[line_start:line_end] < target:
+                lo = line_end + 1
+            else:
+                hi = line_start
+        return lo
+
+    def _record_at(self, pos):
+        mm = self._index_mm
+        if pos >= len(mm):
+            return None
+        line_end = mm.find(b"\n", pos)
+        if line_end < 0:
+            line_end = len(mm)
+        fields = mm[pos:line_end].split(b"\t")
+        return fields + [line_end + 1]
+
+
+def _fingerprint(head, tail):
+    import hashlib  # 起動時間短縮のため、使うときに読み込む
+    h = hashlib.sha256(head)
+    h.update(tail)
+    return h.hexdigest()
+
+
+def _mmap_file(f):
+    if os.fstat(f.fileno()).st_size == 0:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _parse_record(record):
+    key, offset, length, sha256 = record[:4]
+    sha256 = sha256.decode("ascii")
+    return {
+        "key": _unescape_key(key.decode("utf-8")),
+        "offset": int(offset),
+        "length": int(length),
+        "sha256": None if sha256 == "-" else sha256,
+    }
+
+
+def _escape_key(key):
+    return key.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def _unescape_key(key):
+    out = []
+    chars = iter(key)
+    for c in chars:
+        if c == "\\":
+            nxt = next(chars, "")
+            out.append({"t": "\t", "n": "\n"}.get(nxt, nxt))
+        else:
+            out.append(c)
+    return "".join(out)
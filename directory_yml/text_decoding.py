@@ -0,0 +1,164 @@
+"""
+ファイル内容の読み込みとデコード。
+ファイルを一定サイズずつ読み、sha256 の計算とデコードを同じ読み込みの中で行う
+(ファイル全体のバイト列は持たない)。
+デコードした内容は、out を渡せばそこへチャンクごとに書き出す (ContentSpillStore の一時ファイルなど)。
+渡さない場合はチャンクを連結して返すので、連結する間は内容を2つ分持つ。
+
+文字コードの判定:
+  1. BOM があればそれに従う (UTF-8 / UTF-16)
+  2. 候補 (encodings) を順に、先頭のチャンクをエラー無しでデコードできたものを採用する
+  3. どれも当てはまらなければ、先頭の候補でデコードし、デコードできない部分は置換文字にする
+先頭のチャンクでは判定できず、途中でデコードに失敗した場合は、残りの候補でファイルを読み直す。
+BOM があるのにデコードに失敗した場合と、どのチャンクかに NUL を含む場合 (UTF-16 を除く) はバイナリとする。
+"""
+
+import codecs
+import io
+
+DEFAULT_ENCODINGS = ["utf-8", "cp932"]
+
+# 一度に読み込む量
+READ_CHUNK_BYTES = 1024 * 1024
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def read_text(file_path, encodings=None, normalize_newlines=False, with_hash=True, out=None):
+    """
+    戻り値: (sha256, 内容, 文字コード, 読み込んだバイト数)
+    sha256 は with_hash=False なら None。バイナリ (NUL を含む / BOM の文字コードでデコードできない) と判定した場合、内容と文字コードは None。
+    normalize_newlines=True の場合、改行 (CRLF / CR) を LF に統一する (sha256 は元のバイト列のもの)。
+    out (write(str) と reset() を持つもの) を渡すと、デコードした内容はそこへ書き出し、戻り値の内容は out になる。
+    候補を変えて読み直す場合とバイナリと判定した場合は、書き出した分を reset() で捨てる。
+    読み込めない場合は OSError を送出する。
+    """
+    encodings = list(encodings or DEFAULT_ENCODINGS)
+    hasher = None
+    if with_hash:
+        import hashlib  # 起動時間短縮のため、実際にハッシュ計算するときに読み込む
+        hasher = hashlib.sha256()
+
+    with open(file_path, "rb") as f:
+        chunk = f.read(READ_CHUNK_BYTES)
+        encoding, errors = detect_encoding(chunk, encodings)
+        has_bom = _bom_encoding(chunk) is not None
+        decoder = None if encoding is None else _make_decoder(encoding, errors, normalize_newlines)
+        allow_nul = encoding == "utf-16"
+        binary = encoding is None
+        parts = []
+        nbytes = 0
+        failed = False
+        while chunk:
+            nbytes += len(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            # デコードに失敗して decoder を捨てた後も、NUL の確認は全チャンクで続ける
+            if not binary and not allow_nul and b"\0" in chunk:
+                binary = True
+                decoder, parts = None, []
+            if decoder is not None:
+                try:
+                    _emit(parts, out, decoder.decode(chunk))
+                except UnicodeDecodeError:
+                    # 先頭のチャンクだけでは判定しきれなかった → 読み終えてから候補を変えて読み直す
+                    decoder, parts, failed = None, [], True
+            chunk = f.read(READ_CHUNK_BYTES)
+
+    if decoder is not None:
+        try:
+            _emit(parts, out, decoder.decode(b"", final=True))
+        except UnicodeDecodeError:
+            parts, failed = [], True
+
+    digest = hasher.hexdigest() if hasher is not None else None
+    if (binary or failed) and out is not None:
+        out.reset()
+    if binary or (failed and has_bom):
+        # BOM で決まった文字コードでデコードできない → 別の文字コードのテキストではなくバイナリとみなす
+        return digest, None, None, nbytes
+    if failed:
+        remaining = encodings[encodings.index(encoding) + 1:] if encoding in encodings else []
+        text, encoding = _decode_again(file_path, remaining, encodings[0], normalize_newlines, out)
+        return digest, text, encoding, nbytes
+    return digest, "".join(parts) if out is None else out, _canonical_name(encoding), nbytes
+
+
+def detect_encoding(head, encodings):
+    """
+    ファイル先頭のバイト列から文字コードを判定する。
+    戻り値: (文字コード, errors)。バイナリと判定した場合は (None, None)
+    """
+    encoding = _bom_encoding(head)
+    if encoding is not None:
+        return encoding, "strict"
+    if b"\0" in head:
+        return None, None
+    for encoding in encodings:
+        try:
+            # 末尾で文字が途切れていてもよいよう、インクリメンタルデコーダで確認する
+            codecs.getincrementaldecoder(encoding)("strict").decode(head)
+        except (UnicodeDecodeError, LookupError):
+            continue
+        return encoding, "strict"
+    return encodings[0], "replace"
+
+
+def _bom_encoding(head):
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def _emit(parts, out, text):
+    if out is None:
+        parts.append(text)
+    elif text:
+        out.write(text)
+
+
+def _make_decoder(encoding, errors, normalize_newlines):
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    if normalize_newlines:
+        decoder = io.IncrementalNewlineDecoder(decoder, translate=True)
+    return decoder
+
+
+def _decode_again(file_path, encodings, fallback, normalize_newlines, out=None):
+    """
+    候補を順に試して読み直す。どれも失敗した場合は fallback で置換文字を使ってデコードする。
+    戻り値: (内容, 文字コード)。読み直す間に NUL を見つけた場合はバイナリとして (None, None)
+    out の扱いは read_text() と同じ。
+    """
+    for encoding in encodings + [None]:
+        errors = "strict"
+        if encoding is None:
+            encoding, errors = fallback, "replace"
+        decoder = _make_decoder(encoding, errors, normalize_newlines)
+        parts = []
+        try:
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+                    if b"\0" in chunk:
+                        if out is not None:
+                            out.reset()
+                        return None, None
+                    _emit(parts, out, decoder.decode(chunk))
+            _emit(parts, out, decoder.decode(b"", final=True))
+        except (UnicodeDecodeError, LookupError):
+            if out is not None:
+                out.reset()
+            continue
+        return "".join(parts) if out is None else out, _canonical_name(encoding)
+
+
+def _canonical_name(encoding):
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return encoding
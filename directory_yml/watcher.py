@@ -0,0 +1,442 @@
+"""
+ウォッチモード。
+初回に全体を走査した後は、ファイルシステムの変更イベントだけをメモリ上のツリーへ反映し、
+一定時間(debounce)イベントが途切れたところでYAMLを書き出し直す。
+
+- Linux では inotify (ctypes による薄いラッパ) を使う
+- それ以外、または inotify が使えない場合はディレクトリの mtime ポーリングにフォールバック
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .file_processing import EXCLUDED_DIRS, Scanner
+from .yml_generator import unique_root_names, write_yaml
+from .snapshot_index import index_path_for
+
+# inotify のイベントマスク (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_DIR_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+_FILE_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB
+_WATCH_MASK = _DIR_EVENTS | _FILE_EVENTS | IN_ONLYDIR
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """
+    libc の inotify_* を ctypes で呼び出す最小限のラッパ。
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch に失敗しました: {path}")
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """
+        timeout 秒までイベントを待ち、(wd, mask, name) のリストを返す。
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, pos)
+            pos += _EVENT_HEADER.size
+            name = buf[pos:pos + name_len].rstrip(b"\0")
+            pos += name_len
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _create_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return _Inotify()
+    except (OSError, AttributeError):
+        # libc に inotify が無い or 上限に達している
+        return None
+
+
+class SnapshotWatcher:
+    """
+    指定ディレクトリ群を監視し、変更のたびに output_path のYAML(とインデックス)を更新する。
+    """
+
+    def __init__(
+        self,
+        directories,
+        ignore_patterns,
+        output_path,
+        project_name,
+        max_file_size_bytes=None,
+        encodings=None,
+        normalize_newlines=False,
+        progress_callback=None,
+        debounce=0.2,
+        max_delay=0.8,
+        poll_interval=0.5,
+        use_inotify=True
+    ):
+        self.directories = [d for d in directories if os.path.isdir(d)]
+        self.ignore_patterns = ignore_patterns
+        self.output_path = output_path
+        self.project_name = project_name
+        self.max_file_size_bytes = max_file_size_bytes
+        self.scanner = Scanner(
+            ignore_patterns,
+            max_file_size_bytes,
+            encodings=encodings,
+            normalize_newlines=normalize_newlines
+        )
+        self.progress_callback = progress_callback
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+
+        self.structure_data = []
+        # 監視対象ディレクトリの絶対パス -> (root_dir, ディレクトリノード)
+        self._dir_nodes = {}
+        self._dir_mtimes = {}
+        self._recheck_dirs = set()
+        self._stop_event = threading.Event()
+
+        self._inotify = _create_inotify() if use_inotify else None
+        self._wd_to_dir = {}
+        self._dir_to_wd = {}
+
+    # -----------------------------
+    # 実行制御
+    # -----------------------------
+    def run(self):
+        """
+        初回走査と書き出しを行い、stop() が呼ばれるまで監視を続ける。
+        """
+        try:
+            self.initial_scan()
+            self.emit()
+            self._loop()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+    @property
+    def backend_name(self):
+        return "inotify" if self._inotify is not None else "polling"
+
+    def initial_scan(self):
+        self._log(f"初回走査を開始します (監視方式: {self.backend_name})")
+        self.structure_data = []
+        self._dir_nodes = {}
+        for root_dir, root_name in zip(self.directories, unique_root_names(self.directories)):
+            node = self.scanner.scan_directory(root_dir, root_dir)
+            self.structure_data.append({"root": root_name, "children": node})
+            self._register_tree(root_dir, root_dir, node)
+        # 監視の登録は走査の後なので、走査中の追加/変更は通知されない。
+        # 最初のループで全ディレクトリを再列挙し、その間の変更を拾う
+        self._recheck_dirs |= set(self._dir_nodes)
+
+    def emit(self):
+        """
+        現在のツリーを一時ファイルへ書き出し、出力先へ置き換える。
+        """
+        tmp_path = self.output_path + ".tmp"
+        write_yaml(self.structure_data, self.project_name, tmp_path)
+        os.replace(index_path_for(tmp_path), index_path_for(self.output_path))
+        os.replace(tmp_path, self.output_path)
+        self._log(f"YAMLを更新しました: {self.output_path}")
+
+    def _loop(self):
+        dirty_dirs = set()
+        dirty_files = set()
+        first_event_at = None
+        last_event_at = None
+
+        while not self._stop_event.is_set():
+            if self._inotify is not None:
+                wait = self.debounce if first_event_at is not None else self.poll_interval
+                new_dirs, new_files = self._read_inotify(wait)
+            else:
+                self._stop_event.wait(self.poll_interval if first_event_at is None else self.debounce)
+                new_dirs, new_files = self._poll_changes(dirty_dirs, dirty_files)
+                # 反映待ちのものを再検出しても「新しい変更」とはみなさない
+                new_dirs -= dirty_dirs
+                new_files -= dirty_files
+
+            if self._recheck_dirs:
+                new_dirs |= self._recheck_dirs
+                self._recheck_dirs = set()
+
+            now = time.monotonic()
+            if new_dirs or new_files:
+                dirty_dirs |= new_dirs
+                dirty_files |= new_files
+                last_event_at = now
+                if first_event_at is None:
+                    first_event_at = now
+
+            if first_event_at is None:
+                continue
+            # イベントが途切れた or 最初のイベントから max_delay 経過したら反映
+            if now - last_event_at >= self.debounce or now - first_event_at >= self.max_delay:
+                if self.apply_changes(dirty_dirs, dirty_files):
+                    self.emit()
+                dirty_dirs = set()
+                dirty_files = set()
+                first_event_at = last_event_at = None
+
+    # -----------------------------
+    # 変更の反映
+    # -----------------------------
+    def apply_changes(self, dirty_dirs, dirty_files):
+        """
+        変更のあったディレクトリ/ファイルをツリーへ反映する。
+        何か変化があれば True を返す。
+        """
+        changed = False
+        refreshed = set()
+        # 親から先に処理し、消えたディレクトリの子孫は読み飛ばす
+        for dir_path in sorted(dirty_dirs):
+            if dir_path in self._dir_nodes:
+                changed |= self._refresh_directory(dir_path)
+                refreshed.add(dir_path)
+
+        for file_path in sorted(dirty_files):
+            parent = os.path.dirname(file_path)
+            if parent in refreshed or parent not in self._dir_nodes:
+                continue
+            changed |= self._refresh_file(parent, file_path)
+        return changed
+
+    def _refresh_directory(self, dir_path):
+        """
+        ディレクトリ直下を再列挙し、子ノードを付け直す。
+        変化していないファイル/サブディレクトリのノードはそのまま再利用する。
+        """
+        root_dir, node = self._dir_nodes[dir_path]
+        try:
+            items = sorted(os.listdir(dir_path))
+            self._dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            # ディレクトリ自体が消えた → 親ディレクトリ側の再列挙で外れる
+            return False
+
+        old_children = {child["name"]: child for child in node["children"]}
+        new_children = []
+        changed = False
+        for item in items:
+            full_path = os.path.join(dir_path, item)
+            old = old_children.pop(item, None)
+            child = self._reuse_child(old, full_path)
+            if child is None:
+                try:
+                    child = self.scanner.build_child(root_dir, dir_path, item)
+                except OSError:
+                    # 列挙後すぐに消えた一時ファイルなど
+                    child = None
+                if old is not None:
+                    self._unregister_tree(full_path, old)
+                if child is not None and child["type"] == "directory":
+                    self._register_tree(root_dir, full_path, child)
+                    # 走査から監視登録までの間の変更を拾うため、次のループで再列挙する
+                    self._recheck_dirs.add(full_path)
+                changed = True
+            if child is not None:
+                new_children.append(child)
+
+        for name, old in old_children.items():
+            self._unregister_tree(os.path.join(dir_path, name), old)
+            changed = True
+
+        node["children"] = new_children
+        return changed
+
+    def _reuse_child(self, old, full_path):
+        """
+        既存ノードがそのまま使えるなら返す。作り直しが必要なら None。
+        """
+        if old is None:
+            return None
+        is_dir = os.path.isdir(full_path)
+        if old["type"] == "directory":
+            return old if is_dir else None
+        if is_dir:
+            return None
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return None
+        if st.st_size == old["size"] and st.st_mtime == old["mtime"]:
+            return old
+        return None
+
+    def _refresh_file(self, parent, file_path):
+        root_dir, node = self._dir_nodes[parent]
+        name = os.path.basename(file_path)
+        if self.scanner.is_ignored(name):
+            return False
+
+        for i, child in enumerate(node["children"]):
+            if child["name"] == name and child["type"] == "file":
+                try:
+                    new_child = self.scanner.scan_file(root_dir, file_path)
+                except OSError:
+                    return self._refresh_directory(parent)
+                node["children"][i] = new_child
+                return new_child != child
+        # ツリーに無いファイル → ディレクトリごと付け直す
+        return self._refresh_directory(parent)
+
+    # -----------------------------
+    # 監視対象の登録/解除
+    # -----------------------------
+    def _register_tree(self, root_dir, dir_path, node):
+        """
+        dir_path 以下のディレクトリノードを監視対象に登録する。
+        EXCLUDED_DIRS のフォルダは中身を持たないので監視しない。
+        """
+        if node["rel_path"] and node["name"] in EXCLUDED_DIRS:
+            return
+        self._dir_nodes[dir_path] = (root_dir, node)
+        try:
+            self._dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            pass
+        if self._inotify is not None:
+            try:
+                wd = self._inotify.add_watch(dir_path, _WATCH_MASK)
+            except OSError as e:
+                self._log(f"[監視登録失敗] {dir_path}: {e}")
+            else:
+                self._wd_to_dir[wd] = dir_path
+                self._dir_to_wd[dir_path] = wd
+
+        for child in node["children"]:
+            if child["type"] == "directory":
+                self._register_tree(root_dir, os.path.join(dir_path, child["name"]), child)
+
+    def _unregister_tree(self, dir_path, node):
+        if node["type"] != "directory":
+            return
+        for child in node["children"]:
+            self._unregister_tree(os.path.join(dir_path, child["name"]), child)
+        self._dir_nodes.pop(dir_path, None)
+        self._dir_mtimes.pop(dir_path, None)
+        wd = self._dir_to_wd.pop(dir_path, None)
+        if wd is not None:
+            self._wd_to_dir.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    # -----------------------------
+    # 変更検知
+    # -----------------------------
+    def _read_inotify(self, timeout):
+        dirty_dirs = set()
+        dirty_files = set()
+        for wd, mask, name in self._inotify.read_events(timeout):
+            if mask & IN_Q_OVERFLOW:
+                # イベントが溢れた → 全ディレクトリを再列挙
+                dirty_dirs.update(self._dir_nodes)
+                continue
+            dir_path = self._wd_to_dir.get(wd)
+            if dir_path is None:
+                continue
+            if mask & IN_IGNORED:
+                self._wd_to_dir.pop(wd, None)
+                self._dir_to_wd.pop(dir_path, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                dirty_dirs.add(os.path.dirname(dir_path))
+                continue
+            if not name or self.scanner.is_ignored(name):
+                continue
+            if mask & _DIR_EVENTS:
+                dirty_dirs.add(dir_path)
+            elif mask & _FILE_EVENTS and not mask & IN_ISDIR:
+                dirty_files.add(os.path.join(dir_path, name))
+        return dirty_dirs, dirty_files
+
+    def _poll_changes(self, pending_dirs, pending_files):
+        """
+        ポーリング方式の変更検知。
+        ディレクトリの mtime でエントリの増減を、ファイルの (size, mtime) で内容の変更を検出する。
+        反映待ちのもの(pending_dirs / pending_files)は重ねて報告しない。
+        """
+        dirty_dirs = set()
+        dirty_files = set()
+        for dir_path, (_root_dir, node) in list(self._dir_nodes.items()):
+            if dir_path in pending_dirs:
+                continue
+            try:
+                mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                dirty_dirs.add(os.path.dirname(dir_path))
+                continue
+            if mtime != self._dir_mtimes.get(dir_path):
+                self._dir_mtimes[dir_path] = mtime
+                dirty_dirs.add(dir_path)
+                continue
+            for child in node["children"]:
+                if child["type"] != "file":
+                    continue
+                file_path = os.path.join(dir_path, child["name"])
+                if file_path in pending_files:
+                    continue
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    dirty_dirs.add(dir_path)
+                    break
+                if st.st_size != child["size"] or st.st_mtime != child["mtime"]:
+                    dirty_files.add(file_path)
+        return dirty_dirs, dirty_files
+
+    def _log(self, message):
+        if self.progress_callback:
+            self.progress_callback(message)
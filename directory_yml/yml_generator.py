@@ -1,20 +1,192 @@
-import yaml
+import os
+import time
 
-def generate_yaml(structure_data, project_name):
+from .content_store import resolve_content
+
+# yaml は起動を軽くするため、実際に生成するときに読み込む (_get_dumper)
+_yaml_dumper = None
+
+
+def generate_yaml(structure_data, project_name, index=None, stats=None):
     """
     structure_data: collect_directory_structures() の結果 (リスト)
     project_name:   自動生成 or ユーザ設定のプロジェクト名
+    index:          リストを渡すと、各ファイルノードの (key, offset, length, sha256)
+                    を UTF-8 バイトオフセットで追記する (インデックス用)
+    stats:          ScanStats を渡すと serialize フェーズの時間を計測する
+    """
+    if stats is not None:
+        stats.start_profile()
+    try:
+        return "".join(iter_yaml_chunks(structure_data, project_name, index=index, stats=stats))
+    finally:
+        if stats is not None:
+            stats.stop_profile()
+
+
+def write_yaml(structure_data, project_name, output_path, write_index=True, stats=None):
+    """
+    YAMLをファイルへ逐次書き出す。
+    write_index=True の場合、同じ場所にインデックス(サイドカー)も書き出す。
+    戻り値: インデックスのエントリ数
+    """
+    from .snapshot_index import index_path_for, write_index_file
+
+    index = [] if write_index else None
+    if stats is not None:
+        stats.start_profile()
+    try:
+        _write_chunks(structure_data, project_name, output_path, index, stats)
+    finally:
+        if stats is not None:
+            stats.stop_profile()
+    if index is None:
+        return 0
+    write_index_file(index_path_for(output_path), index, output_path)
+    return len(index)
+
+
+def _write_chunks(structure_data, project_name, output_path, index, stats):
+    with open(output_path, "wb") as f:
+        for chunk in iter_yaml_chunks(structure_data, project_name, index=index, stats=stats):
+            if stats is None:
+                f.write(chunk.encode("utf-8"))
+            else:
+                t = time.perf_counter()
+                f.write(chunk.encode("utf-8"))
+                stats.add("write", time.perf_counter() - t)
+
+
+def iter_yaml_chunks(structure_data, project_name, index=None, stats=None):
+    """
+    YAMLテキストを断片ごとに生成するジェネレータ。
+    出力は yaml.dump() で文書全体を出力した場合と同じ構造になる。
+    ファイルノードは1ノード=1断片なので、index を渡すと断片の位置を記録できる。
+    """
+    offset = 0
+    document = _iter_document(structure_data, project_name)
+    if stats is not None:
+        document = _timed(document, stats, "serialize")
+    for chunk, key, node in document:
+        if index is not None:
+            length = len(chunk.encode("utf-8"))
+            if key is not None:
+                index.append((key, offset, length, node.get("sha256")))
+            offset += length
+        yield chunk
+
+
+def _timed(iterator, stats, phase):
+    """
+    iterator から次の要素を取り出すのにかかった時間を phase として計上する。
     """
-    root_data = {
-        "project": {
-            "name": project_name,
-            "structure": structure_data
-        }
-    }
-    return yaml.dump(
-        root_data,
+    while True:
+        t = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats.add(phase, time.perf_counter() - t, count=0)
+            return
+        stats.add(phase, time.perf_counter() - t)
+        yield item
+
+
+def _iter_document(structure_data, project_name):
+    yield "project:\n", None, None
+    yield _indent(_dump({"name": project_name}), "  "), None, None
+    if not structure_data:
+        yield "  structure: []\n", None, None
+        return
+
+    yield "  structure:\n", None, None
+    for root in structure_data:
+        root_name = root.get("root", "")
+        header = {k: v for k, v in root.items() if k != "children"}
+        yield _indent(_dump([header]), "  "), None, None
+        children = root.get("children")
+        if isinstance(children, dict):
+            yield "    children:\n", None, None
+            yield from _iter_node(children, 6, root_name, as_item=False)
+        else:
+            yield _indent(_dump({"children": children}), "    "), None, None
+
+
+def _iter_node(node, indent, root_name, as_item=True):
+    pad = " " * indent
+    if node.get("type") == "file":
+        # 一時ファイルへ逃がした内容は、ここで1ノード分ずつ読み戻す
+        text = _indent(_dump([resolve_content(node)]), pad)
+        yield text, make_index_key(root_name, node.get("rel_path", "")), node
+        return
+
+    header = {k: v for k, v in node.items() if k != "children"}
+    children = node.get("children") or []
+    if as_item:
+        yield _indent(_dump([header]), pad), None, None
+        child_pad = pad + "  "
+    else:
+        yield _indent(_dump(header), pad), None, None
+        child_pad = pad
+
+    if not children:
+        yield child_pad + "children: []\n", None, None
+        return
+    yield child_pad + "children:\n", None, None
+    for child in children:
+        yield from _iter_node(child, len(child_pad), root_name)
+
+
+def unique_root_names(directories):
+    """
+    ルート名 (ディレクトリ名) のリスト。同じ名前のルートが複数ある場合、2つ目以降は "src (2)" のように
+    番号を付け、インデックスのキー (ルート名/rel_path) が重複しないようにする。
+    """
+    names = []
+    used = set()
+    for directory in directories:
+        base = os.path.basename(os.path.normpath(directory))
+        name = base
+        n = 2
+        while name in used:
+            name = f"{base} ({n})"
+            n += 1
+        used.add(name)
+        names.append(name)
+    return names
+
+
+def make_index_key(root_name, rel_path):
+    """
+    インデックスのキー。ルート名と rel_path を '/' 区切りで連結する。
+    """
+    rel_path = rel_path.replace(os.sep, "/")
+    return f"{root_name}/{rel_path}" if rel_path else root_name
+
+
+def _get_dumper():
+    global _yaml_dumper
+    if _yaml_dumper is None:
+        import yaml
+        # libyaml が使える環境では C 実装の Dumper を使う
+        _yaml_dumper = (yaml.dump, getattr(yaml, "CSafeDumper", yaml.SafeDumper))
+    return _yaml_dumper
+
+
+def _dump(data):
+    dump, dumper = _get_dumper()
+    return dump(
+        data,
+        Dumper=dumper,
         allow_unicode=True,
         sort_keys=False,
         default_flow_style=False,
         indent=2
     )
+
+
+def _indent(text, pad):
+    if not pad:
+        return text
+    lines = text.split("\n")
+    # 末尾の改行の後ろは空文字になるため、空行と同様にインデントを付けない
+    return "\n".join(pad + line if line.strip() else line for line in lines)
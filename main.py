@@ -1,8 +1,16 @@
+import sys
+
+
 def main():
     """
     アプリケーションのエントリーポイント。
-    GUIの初期化を行い、メインループを開始する。
+    引数なしの場合はGUIの初期化を行い、メインループを開始する。
+    サブコマンドが指定された場合はCLIとして動作する。
     """
+    if len(sys.argv) > 1:
+        from directory_yml.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
     from directory_yml.gui import DirectoryYmlGUI
     app = DirectoryYmlGUI()
     app.run()